@@ -0,0 +1,165 @@
+"""
+Array backed world for proggitquiz 4 - cities and dispensers are coordinate arrays,
+board is an occupancy grid. Scales to much bigger worlds than bacon.World.
+"""
+
+import sys
+import numpy
+
+from bacon import accept_func
+
+EMPTY, CITY, DISP = 0, 1, 2
+CELL_CHARS = numpy.array([".", "P", "d"])
+
+class ArrayWorld(object):
+
+    def __init__(self, width, height, disp_num, city_coords, rng=numpy.random):
+        """
+        city_coords is cities_num x 2 array of (row, col), dispensers are placed by numpy
+        random generator rng
+        """
+        city_coords = numpy.asarray(city_coords, dtype=numpy.int64).reshape(-1, 2)
+        if (disp_num + len(city_coords)) > width * height:
+            print "too many cities and dispensers for too small grid"
+            sys.exit(1)
+        self.width = width
+        self.height = height
+        self.city_coords = city_coords
+        grid = numpy.zeros((height, width), dtype=numpy.int8)
+        grid[city_coords[:, 0], city_coords[:, 1]] = CITY
+        free_cells = numpy.flatnonzero(grid.ravel() == EMPTY)
+        cells = rng.choice(free_cells, disp_num, replace=False).astype(numpy.int64)
+        self._init(numpy.column_stack([cells / width, cells % width]))
+
+    def _init(self, disp_coords):
+        self.disp_coords = numpy.array(disp_coords, dtype=numpy.int64).reshape(-1, 2)
+        self.grid = numpy.zeros((self.height, self.width), dtype=numpy.int8)
+        self.grid[self.city_coords[:, 0], self.city_coords[:, 1]] = CITY
+        assert(not self.grid[self.disp_coords[:, 0], self.disp_coords[:, 1]].any())
+        self.grid[self.disp_coords[:, 0], self.disp_coords[:, 1]] = DISP
+        #cities x dispensers distance matrix
+        self.distances = self.calc_distances(self.disp_coords)
+        self._update_nearest()
+
+    def calc_distances(self, coords):
+        """
+        Manhattan distances from all cities to coords as cities x len(coords) matrix
+        """
+        return numpy.abs(self.city_coords[:, None, :] - coords[None, :, :]).sum(axis=2)
+
+    def _update_nearest(self):
+        cities = numpy.arange(len(self.city_coords))
+        self.near_disp = self.distances.argmin(axis=1)
+        self.near_dist = self.distances[cities, self.near_disp]
+        if self.distances.shape[1] > 1:
+            self.second_dist = numpy.partition(self.distances, 1, axis=1)[:, 1]
+        else:
+            self.second_dist = numpy.empty_like(self.near_dist)
+            self.second_dist.fill(numpy.iinfo(numpy.int64).max)
+        self.total_distance = int(self.near_dist.sum())
+
+    def get_fitness(self):
+        return self.total_distance
+
+    def get_solution(self):
+        return [tuple(coord) for coord in self.disp_coords.tolist()]
+
+    def plug_in_solution(self, solution):
+        self._init(solution)
+
+    def move_deltas(self, disp_indices, new_coords):
+        """
+        Changes of total distance for many candidate moves (disp_indices[i] to new_coords[i])
+        evaluated independently in one pass. Returns (deltas, valid) - moves to occupied
+        or off-board cells are not valid.
+        """
+        disp_indices = numpy.asarray(disp_indices)
+        new_coords = numpy.asarray(new_coords, dtype=numpy.int64).reshape(-1, 2)
+        valid = ((new_coords >= 0).all(axis=1) & (new_coords[:, 0] < self.height)
+                 & (new_coords[:, 1] < self.width))
+        valid[valid] = self.grid[new_coords[valid, 0], new_coords[valid, 1]] == EMPTY
+        new_dist = self.calc_distances(new_coords)
+        #nearest distance of every city if the moved dispenser disappeared
+        without = numpy.where(self.near_disp[:, None] == disp_indices[None, :],
+                              self.second_dist[:, None], self.near_dist[:, None])
+        deltas = numpy.minimum(without, new_dist).sum(axis=0) - self.total_distance
+        return deltas, valid
+
+    def move_disp(self, index, new_coord):
+        row, col = new_coord
+        if not (0 <= row < self.height and 0 <= col < self.width) or self.grid[row, col] != EMPTY:
+            return False
+        old_row, old_col = self.disp_coords[index]
+        self.grid[old_row, old_col] = EMPTY
+        self.grid[row, col] = DISP
+        self.disp_coords[index] = new_coord
+        self.distances[:, index] = numpy.abs(self.city_coords - self.disp_coords[index]).sum(axis=1)
+        self._update_nearest()
+        return True
+
+    def to_nice_str(self):
+        rows = CELL_CHARS[self.grid]
+        return "".join("".join(row) + "\n" for row in rows)
+
+    def __str__(self):
+        return "\n size:%sx%s\n total distance: %d \n cities:%s\n dispensers:%s" % \
+             (self.height, self.width, self.total_distance, len(self.city_coords), len(self.disp_coords))
+
+    @classmethod
+    def from_lines(cls, world_lines, rng=numpy.random):
+        size, disp_num = world_lines[0].split()
+        width, height = size.split("x")
+        city_coords = [(row, col) for row, line in enumerate(world_lines[1:])
+                                  for col, c in enumerate(line) if c == 'P']
+        return cls(int(width), int(height), int(disp_num), city_coords, rng)
+
+def get_new_coords(coords, height, width, temp, rng):
+    """
+    Vectorized bacon.get_new_coord - random jumps shrinking with temp, may land off board
+    """
+    steps = numpy.column_stack([rng.randint(1, max(int(height * temp), 1) + 1, len(coords)),
+                                rng.randint(1, max(int(width * temp), 1) + 1, len(coords))])
+    return coords + steps * rng.choice([1, -1], size=coords.shape)
+
+def run(world, iters, print_results_freq, batch_size=32, rng=None):
+    """
+    Annealing with batched proposals - each iteration evaluates batch_size random moves
+    at once and considers the best valid of them for acceptance.
+    """
+    rng = rng or numpy.random.RandomState()
+    print "running search on world: %s" % world
+    current_fitness = best_fitness = world.get_fitness()
+    best_solution = world.get_solution()
+    temp_min = 4
+    temp = 10
+    disps_num = len(world.disp_coords)
+    for i in xrange(iters):
+        if i % print_results_freq == 0:
+            print "iter %d current fitness: %f best fitness: %f" % (i, current_fitness, best_fitness)
+        temp = max(temp_min, 0.9998 * temp)
+        disp_indices = rng.randint(0, disps_num, batch_size)
+        new_coords = get_new_coords(world.disp_coords[disp_indices], world.height, world.width,
+                                    1 - float(i) / iters, rng)
+        deltas, valid = world.move_deltas(disp_indices, new_coords)
+        if not valid.any():
+            continue
+        best = numpy.flatnonzero(valid)[deltas[valid].argmin()]
+        if accept_func(-float(deltas[best]), temp) > rng.random_sample():
+            world.move_disp(disp_indices[best], new_coords[best])
+            current_fitness = world.get_fitness()
+            if current_fitness < best_fitness:
+                best_fitness = current_fitness
+                best_solution = world.get_solution()
+
+    world.plug_in_solution(best_solution)
+    print best_fitness, best_solution
+    print world.to_nice_str(), world.get_fitness()
+    return best_fitness
+
+def search(fp, seed=None):
+    rng = numpy.random.RandomState(seed)
+    world = ArrayWorld.from_lines(open(fp, "r").readlines(), rng)
+    run(world, 10000, 1000, rng=rng)
+
+if __name__ == '__main__':
+    search(sys.argv[1])
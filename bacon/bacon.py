@@ -4,7 +4,11 @@ solution to proggitquiz 4: http://proggitquiz.com/challenge/4/
 
 import sys
 import random
+import time
 from math import exp
+from multiprocessing import Pool
+
+INFINITY = sys.maxint
 
 def calc_distance(coord1, coord2):
     return abs(coord1[0] - coord2[0]) + abs(coord1[1] - coord2[1])
@@ -12,6 +16,8 @@ def calc_distance(coord1, coord2):
 class Disp():
     def __init__(self, coord):
         self.coord = coord
+        #position in world.disps
+        self.index = None
 
     def get_coord(self):
         return self.coord
@@ -34,7 +40,7 @@ class City():
 
 class World(object):
 
-    def __init__(self, width, height, disp_num, cities):
+    def __init__(self, width, height, disp_num, cities, rng=random):
         if (disp_num + len(cities)) > width * height:
             print "too many cities and dispensers for too small grid"
             sys.exit(1)
@@ -46,14 +52,35 @@ class World(object):
         cities_coords = set([city.get_coord() for city in self.cities])
         all_coords = [(row, col) for row in xrange(self.height) for col in xrange(self.width) 
                                       if (row, col) not in cities_coords]
-        disps = [Disp(coord) for coord in random.sample(all_coords, disp_num)]
+        disps = [Disp(coord) for coord in rng.sample(all_coords, disp_num)]
         self._init(disps)
 
     def _init(self, disps):
         self.disps = disps
+        for index, disp in enumerate(self.disps):
+            disp.index = index
         self.occupied = set([elem.get_coord() for elem in self.cities + self.disps])
+        self.city_coords = [city.get_coord() for city in self.cities]
+        #per city distance to and index of the nearest and the second nearest dispenser
+        cities_num = len(self.cities)
+        self.near_dist, self.near_disp = [0] * cities_num, [0] * cities_num
+        self.second_dist, self.second_disp = [0] * cities_num, [0] * cities_num
+        for city_index in xrange(cities_num):
+            self._rescan_city(city_index)
         #total distance from all houses to nearest dispensers
-        self.total_distance = self._calc_total_distance()
+        self.total_distance = sum(self.near_dist)
+
+    def _rescan_city(self, city_index):
+        coord = self.city_coords[city_index]
+        near = second = (INFINITY, None)
+        for disp in self.disps:
+            candidate = (calc_distance(coord, disp.get_coord()), disp.index)
+            if candidate < near:
+                near, second = candidate, near
+            elif candidate < second:
+                second = candidate
+        self.near_dist[city_index], self.near_disp[city_index] = near
+        self.second_dist[city_index], self.second_disp[city_index] = second
 
     def get_solution(self):
         return [disp.get_coord() for disp in self.disps]
@@ -80,18 +107,63 @@ class World(object):
             output.append("\n")
         return "".join(output)
 
+    def move_delta(self, disp, new_disp_coord):
+        """
+        Change of total distance if disp moved to new_disp_coord (None if the coord is occupied).
+        Nothing is changed - O(cities) using nearest and second nearest dispensers of cities.
+        """
+        if new_disp_coord in self.occupied:
+            return None
+        index = disp.index
+        near_dist, near_disp, second_dist = self.near_dist, self.near_disp, self.second_dist
+        delta = 0
+        for city_index, coord in enumerate(self.city_coords):
+            new_dist = abs(coord[0] - new_disp_coord[0]) + abs(coord[1] - new_disp_coord[1])
+            if near_disp[city_index] == index:
+                delta += min(new_dist, second_dist[city_index]) - near_dist[city_index]
+            elif new_dist < near_dist[city_index]:
+                delta += new_dist - near_dist[city_index]
+        return delta
+
     def move_disp(self, disp, new_disp_coord):
         #print map(str, self.occupied)
         #print disp.get_coord(), new_disp_coord
         if new_disp_coord not in self.occupied:
+            self.total_distance += self.move_delta(disp, new_disp_coord)
             self.occupied.remove(disp.get_coord())
             disp.move(new_disp_coord)
             self.occupied.add(new_disp_coord)
-            #TODO inefficient - we calculate total distance every step again
-            self.total_distance = self._calc_total_distance()
+            self._update_nearest(disp.index, new_disp_coord)
             return True
         return False
 
+    def _update_nearest(self, index, new_disp_coord):
+        """
+        Updates nearest dispensers of cities after dispenser index moved to new_disp_coord
+        """
+        near_dist, near_disp = self.near_dist, self.near_disp
+        second_dist, second_disp = self.second_dist, self.second_disp
+        for city_index, coord in enumerate(self.city_coords):
+            new_dist = abs(coord[0] - new_disp_coord[0]) + abs(coord[1] - new_disp_coord[1])
+            if near_disp[city_index] == index:
+                if new_dist <= second_dist[city_index]:
+                    near_dist[city_index] = new_dist
+                else:
+                    self._rescan_city(city_index)
+            elif second_disp[city_index] == index:
+                if new_dist < near_dist[city_index]:
+                    second_dist[city_index], second_disp[city_index] = near_dist[city_index], near_disp[city_index]
+                    near_dist[city_index], near_disp[city_index] = new_dist, index
+                elif new_dist <= second_dist[city_index]:
+                    second_dist[city_index] = new_dist
+                else:
+                    self._rescan_city(city_index)
+            elif new_dist < near_dist[city_index]:
+                second_dist[city_index], second_disp[city_index] = near_dist[city_index], near_disp[city_index]
+                near_dist[city_index], near_disp[city_index] = new_dist, index
+            elif new_dist < second_dist[city_index]:
+                second_dist[city_index], second_disp[city_index] = new_dist, index
+
     def get_fitness(self):
         return self.total_distance
 
@@ -110,7 +182,7 @@ class World(object):
              (self.height, self.width, self.total_distance, map(str, self.cities), map(str, self.disps))
 
     @classmethod
-    def from_lines(cls, world_lines):
+    def from_lines(cls, world_lines, rng=random):
         size, disp_num = world_lines[0].split()
         width, height = size.split("x")
 
@@ -123,15 +195,16 @@ class World(object):
                     cities.append(City((row, col)))
                 col += 1
             row += 1 
-        return cls(int(width), int(height), int(disp_num), cities)
+        return cls(int(width), int(height), int(disp_num), cities, rng)
 
 def accept_func(fitness_diff, temp):
-    return exp(fitness_diff/temp)
+    #improvements are always accepted - big ones would overflow exp
+    return exp(min(fitness_diff/temp, 0))
 
-def get_new_coord(coord, height, width, temp):  
-    hstep = random.randint(1, max(int(height * temp), 1))
-    wstep = random.randint(1, max(int(width * temp), 1))
-    hdir, wdir = random.choice([1, -1]), random.choice([1, -1])
+def get_new_coord(coord, height, width, temp, rng=random):  
+    hstep = rng.randint(1, max(int(height * temp), 1))
+    wstep = rng.randint(1, max(int(width * temp), 1))
+    hdir, wdir = rng.choice([1, -1]), rng.choice([1, -1])
     #print temp, hstep, wstep
     new_coord = (coord[0] + hstep * hdir, coord[1] + wstep * wdir)
     if (new_coord[0] >= 0 and new_coord[1] >= 0) and (new_coord[0] < height and new_coord[1] < width):
@@ -139,35 +212,136 @@ def get_new_coord(coord, height, width, temp):
         return new_coord
     return None
     
-def get_random_coord(coord, height, width, temp):  
-    return (random.randint(0, height - 1), random.randint(0, width - 1)) 
+def get_random_coord(coord, height, width, temp, rng=random):  
+    return (rng.randint(0, height - 1), rng.randint(0, width - 1)) 
 
-def run(world, iters, print_results_freq, restart_threshold):
-    print "running search on world: %s" % world
+#heurs
+TEMP_MIN = 4
+TEMP_MAX = 10
+TEMP_DECAY = 0.9998
+
+class GeometricCooling(object):
+    """
+    Temperature decays by a constant factor every iteration down to temp_min
+    """
+    def __init__(self, temp_max=TEMP_MAX, temp_min=TEMP_MIN, decay=TEMP_DECAY):
+        self.temp = temp_max
+        self.temp_min = temp_min
+        self.decay = decay
+
+    def update(self, accepted, improved):
+        self.temp = max(self.temp_min, self.decay * self.temp)
+
+class AdaptiveCooling(object):
+    """
+    Temperature is tuned to keep acceptance rate (measured over window iterations) around target
+    """
+    def __init__(self, target=0.3, window=100, factor=1.1, temp_max=TEMP_MAX, temp_min=0.1):
+        self.temp = temp_max
+        self.temp_max = temp_max
+        self.temp_min = temp_min
+        self.target = target
+        self.window = window
+        self.factor = factor
+        self.iters = self.accepted = 0
+
+    def update(self, accepted, improved):
+        self.iters += 1
+        self.accepted += accepted
+        if self.iters == self.window:
+            if float(self.accepted) / self.iters > self.target:
+                self.temp = max(self.temp_min, self.temp / self.factor)
+            else:
+                self.temp = min(self.temp_max, self.temp * self.factor)
+            self.iters = self.accepted = 0
+
+class ReheatingCooling(GeometricCooling):
+    """
+    Geometric cooling, but temperature jumps back to reheat_temp after patience iterations without improvement
+    """
+    def __init__(self, patience=1000, reheat_temp=TEMP_MAX, **kwargs):
+        GeometricCooling.__init__(self, **kwargs)
+        self.patience = patience
+        self.reheat_temp = reheat_temp
+        self.stalled = 0
+
+    def update(self, accepted, improved):
+        GeometricCooling.update(self, accepted, improved)
+        self.stalled = 0 if improved else self.stalled + 1
+        if self.stalled >= self.patience:
+            self.temp = self.reheat_temp
+            self.stalled = 0
+
+def linear_move_scale(progress):
+    """
+    Maximal jump of dispenser as fraction of the world size, given progress of search 0..1
+    """
+    return 1 - progress
+
+def anneal_metrics(world, iters, restart_threshold, schedule=None, rng=random, start_iter=0,
+                   total_iters=None, move_scale=linear_move_scale, metrics_freq=100, stats=None):
+    """
+    Simulated annealing of world in iterations start_iter..iters, generator of metrics
+    (dict with iteration, temperature, rates of accepted and invalid proposals, fitness,
+    iters/sec) yielded every metrics_freq iterations.
+
+    Move radius shrinks with the progress through total_iters, so a long search can be run
+    in parts. Overall stats of the search are filled in the stats dict, world is left in the
+    current (not the best) state.
+    """
+    schedule = schedule or GeometricCooling()
+    total_iters = total_iters or iters
+    stats = stats if stats is not None else {}
     current_fitness = best_fitness = world.get_fitness() 
     best_solution = world.get_solution()
     invalid_coords_num = 0
+    occupied_num = 0
+    accepted_num = 0
     restarts_num = 0
     restart_counter = 0
-    #heurs
-    temp_min = 4 
-    temp = temp_max = 10 
-    for i in xrange(10, iters):
-        if i % print_results_freq == 0:
-            print "iter %d current fitness: %f best fitness: %f" % (i, current_fitness, best_fitness)
-        temp = max(temp_min, 0.9998 * temp)
+    #counters of the current metrics window
+    window_start, window_time = start_iter, time.time()
+    window_accepted = window_invalid = 0
+    for i in xrange(start_iter, iters):
+        if metrics_freq and i > window_start and i % metrics_freq == 0:
+            now = time.time()
+            window = i - window_start
+            yield {
+                   "iter": i,
+                   "temp": schedule.temp,
+                   "acceptance_rate": float(window_accepted) / window,
+                   "invalid_rate": float(window_invalid) / window,
+                   "fitness": current_fitness,
+                   "best_fitness": best_fitness,
+                   "iters_per_sec": window / max(now - window_time, 1e-9),
+                  }
+            window_start, window_time = i, now
+            window_accepted = window_invalid = 0
+        accepted = improved = False
         #try to move random disp
-        disp = random.choice(world.disps)
-        old_coord = disp.get_coord()
-        new_coord = get_new_coord(old_coord, world.height, world.width, 1 - float(i)/iters)
+        disp = rng.choice(world.disps)
+        new_coord = get_new_coord(disp.get_coord(), world.height, world.width,
+                                  move_scale(float(i) / total_iters), rng)
         if not new_coord:
             invalid_coords_num += 1
+            window_invalid += 1
+            schedule.update(accepted, improved)
             continue
-        if not world.move_disp(disp, new_coord):
+        fitness_diff = world.move_delta(disp, new_coord)
+        if fitness_diff is None:
+            occupied_num += 1
+            window_invalid += 1
+            schedule.update(accepted, improved)
             continue
-        if accept_func(current_fitness - world.get_fitness(), temp) > random.random():
+        #rejected moves are never applied, so there is nothing to roll back
+        if accept_func(-fitness_diff, schedule.temp) > rng.random():
+            world.move_disp(disp, new_coord)
+            accepted = True
+            accepted_num += 1
+            window_accepted += 1
             current_fitness = world.get_fitness()
             if current_fitness < best_fitness:
+                improved = True
                 best_fitness = current_fitness
                 best_solution = world.get_solution()
                 restart_counter = 0
@@ -177,23 +351,141 @@ def run(world, iters, print_results_freq, restart_threshold):
                     world.plug_in_solution(best_solution)
                     restarts_num += 1
                 restart_counter += 1
-        else:
-            #rollback
-            rollback = world.move_disp(disp, old_coord)
-            assert(rollback)
+        schedule.update(accepted, improved)
+
+    stats.update({
+            "best_fitness": best_fitness,
+            "best_solution": best_solution,
+            "schedule": schedule,
+            "iters": iters - start_iter,
+            "accepted": accepted_num,
+            "invalid_coords": invalid_coords_num,
+            "occupied": occupied_num,
+            "restarts": restarts_num,
+           })
+
+def anneal(world, iters, restart_threshold, schedule=None, rng=random, start_iter=0, total_iters=None,
+           move_scale=linear_move_scale, metrics_freq=None, callback=None):
+    """
+    Runs anneal_metrics to the end, metrics are passed to callback. Returns stats of the search.
+    """
+    stats = {}
+    for metrics in anneal_metrics(world, iters, restart_threshold, schedule, rng, start_iter, total_iters,
+                                  move_scale, callback and metrics_freq, stats):
+        callback(metrics)
+    return stats
+
+def print_metrics(metrics):
+    print "iter %d current fitness: %f best fitness: %f temp: %.3f accepted: %.3f invalid: %.3f iters/s: %d" % \
+        (metrics["iter"], metrics["fitness"], metrics["best_fitness"], metrics["temp"],
+         metrics["acceptance_rate"], metrics["invalid_rate"], metrics["iters_per_sec"])
+
+def run(world, iters, print_results_freq, restart_threshold, schedule=None):
+    print "running search on world: %s" % world
+    stats = anneal(world, iters, restart_threshold, schedule, start_iter=10,
+                   metrics_freq=print_results_freq, callback=print_metrics)
+    best_fitness, best_solution = stats["best_fitness"], stats["best_solution"]
 
     #print results
     world.plug_in_solution(best_solution)
-    print "invalid coords: %s" % invalid_coords_num
-    print "restarts: %s" % restarts_num
+    print "invalid coords: %s" % stats["invalid_coords"]
+    print "restarts: %s" % stats["restarts"]
     print best_fitness, map(str, best_solution)
     print world.to_nice_str(), world.get_fitness()
 
+def _run_chain(args):
+    """
+    One epoch of one annealing chain - runs in a worker process
+    """
+    world_lines, solution, seed, start_iter, iters, total_iters, schedule, restart_threshold = args
+    rng = random.Random(seed)
+    world = World.from_lines(world_lines, rng)
+    if solution:
+        world.plug_in_solution(solution)
+    stats = anneal(world, iters, restart_threshold, schedule, rng, start_iter, total_iters)
+    stats["solution"] = world.get_solution()
+    stats["fitness"] = world.get_fitness()
+    return stats
+
+def run_parallel(world_lines, chains_num, iters, exchange_freq, restart_threshold=25,
+                 tempering=False, seed=None, processes=None):
+    """
+    Runs chains_num annealing chains in a process pool, every exchange_freq iterations
+    the chains exchange solutions:
+        * multi-start - the chain with the worst current solution continues from the global best
+        * tempering (replica exchange) - chains run at fixed temperatures between TEMP_MIN and
+          TEMP_MAX, neighbouring chains swap solutions with Metropolis probability
+    Every chain draws from its own seeded rng, so whole run is reproducible given seed.
+    Returns (best fitness, best solution, per chain stats).
+    """
+    master_rng = random.Random(seed)
+    if tempering and chains_num > 1:
+        temps = [TEMP_MIN * (float(TEMP_MAX) / TEMP_MIN) ** (float(i) / (chains_num - 1))
+                    for i in xrange(chains_num)]
+        schedules = [GeometricCooling(temp, temp) for temp in temps]
+    else:
+        schedules = [GeometricCooling() for _ in xrange(chains_num)]
+    solutions = [None] * chains_num
+    fitnesses = [None] * chains_num
+    chain_stats = [{"best_fitness": INFINITY, "accepted": 0, "invalid_coords": 0, "restarts": 0,
+                    "exchanges": 0} for _ in xrange(chains_num)]
+    best_fitness, best_solution = INFINITY, None
+
+    pool = Pool(processes)
+    try:
+        for start_iter in xrange(0, iters, exchange_freq):
+            end_iter = min(iters, start_iter + exchange_freq)
+            tasks = [(world_lines, solutions[i], master_rng.getrandbits(32), start_iter, end_iter, iters,
+                      schedules[i], restart_threshold) for i in xrange(chains_num)]
+            for i, stats in enumerate(pool.map(_run_chain, tasks)):
+                solutions[i], fitnesses[i] = stats["solution"], stats["fitness"]
+                schedules[i] = stats["schedule"]
+                for key in ["accepted", "invalid_coords", "restarts"]:
+                    chain_stats[i][key] += stats[key]
+                if stats["best_fitness"] < chain_stats[i]["best_fitness"]:
+                    chain_stats[i]["best_fitness"] = stats["best_fitness"]
+                if stats["best_fitness"] < best_fitness:
+                    best_fitness, best_solution = stats["best_fitness"], stats["best_solution"]
+
+            if tempering:
+                for i in xrange(chains_num - 1):
+                    #swap probability of replicas at temps[i] < temps[i + 1]
+                    exponent = (fitnesses[i] - fitnesses[i + 1]) * \
+                        (1.0 / schedules[i].temp - 1.0 / schedules[i + 1].temp)
+                    if exponent >= 0 or exp(exponent) > master_rng.random():
+                        solutions[i], solutions[i + 1] = solutions[i + 1], solutions[i]
+                        fitnesses[i], fitnesses[i + 1] = fitnesses[i + 1], fitnesses[i]
+                        chain_stats[i]["exchanges"] += 1
+                        chain_stats[i + 1]["exchanges"] += 1
+            else:
+                worst = max(xrange(chains_num), key=fitnesses.__getitem__)
+                if fitnesses[worst] > best_fitness:
+                    solutions[worst], fitnesses[worst] = best_solution, best_fitness
+                    chain_stats[worst]["exchanges"] += 1
+    finally:
+        pool.close()
+        pool.join()
+    return best_fitness, best_solution, chain_stats
+
 def search(fp):
     world = World.from_lines(open(fp, "r").readlines())
     run(world, 10000, 100, 25)
 
+def search_parallel(fp, chains_num, tempering=False):
+    world_lines = open(fp, "r").readlines()
+    best_fitness, best_solution, chain_stats = run_parallel(world_lines, chains_num, 10000, 1000,
+                                                            tempering=tempering)
+    for i, stats in enumerate(chain_stats):
+        print "chain %d: %s" % (i, stats)
+    world = World.from_lines(world_lines)
+    world.plug_in_solution(best_solution)
+    print best_fitness, map(str, best_solution)
+    print world.to_nice_str(), world.get_fitness()
+
 if __name__ == '__main__':
-    search(sys.argv[1])
+    if len(sys.argv) > 2:
+        search_parallel(sys.argv[1], int(sys.argv[2]), len(sys.argv) > 3 and sys.argv[3] == "tempering")
+    else:
+        search(sys.argv[1])
 
 
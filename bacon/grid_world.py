@@ -0,0 +1,342 @@
+"""
+Spatial index backend for proggitquiz 4 - bacon.World for big grids with many cities.
+
+    * cities and dispensers are bucketed in uniform grids, nearest dispensers of a city are
+      found by scanning rings of buckets around it until no closer one can exist
+    * a move of dispenser only visits cities served by it (nearest or second nearest)
+      and cities in buckets close enough to the new position - every bucket keeps an upper
+      bound of the second nearest distance of its cities
+    * free cells are sampled by rejection, without the list of all the free cells
+    * .wld files are parsed line by line (and generated the same way)
+
+GridWorld has the interface of World, so it runs with bacon.anneal.
+"""
+
+import sys
+import random
+from math import sqrt
+
+from bacon import World, Disp, City, INFINITY, calc_distance, anneal, print_metrics
+
+#average number of cities (dispensers) in a bucket
+CITIES_PER_BUCKET = 8
+DISPS_PER_BUCKET = 2
+#bucket bounds get stale (too high) as dispensers move - recomputed every REFRESH_FREQ moves
+REFRESH_FREQ = 1000
+
+class GridIndex(object):
+    """
+    Items with coords in buckets of cell_size x cell_size cells
+    """
+    def __init__(self, cell_size, height, width):
+        self.cell_size = cell_size
+        self.rows = (height + cell_size - 1) / cell_size
+        self.cols = (width + cell_size - 1) / cell_size
+        self.buckets = {}
+        self.coords = {}
+
+    @classmethod
+    def for_items(cls, height, width, items_num, per_bucket):
+        cell_size = int(sqrt(height * width * per_bucket / float(max(items_num, 1))))
+        return cls(max(1, min(cell_size, max(height, width))), height, width)
+
+    def key(self, coord):
+        return (coord[0] / self.cell_size, coord[1] / self.cell_size)
+
+    def add(self, item, coord):
+        self.coords[item] = coord
+        self.buckets.setdefault(self.key(coord), set()).add(item)
+
+    def remove(self, item):
+        key = self.key(self.coords.pop(item))
+        bucket = self.buckets[key]
+        bucket.discard(item)
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, item, coord):
+        self.remove(item)
+        self.add(item, coord)
+
+    def ring_bound(self, ring):
+        """
+        Lower bound of distance from a cell to any cell of buckets in ring around its bucket
+        """
+        return ring and (ring - 1) * self.cell_size + 1
+
+    def bucket_bound(self, coord, key):
+        """
+        Distance from coord to the closest cell of bucket key
+        """
+        size = self.cell_size
+        row, col = coord
+        top, left = key[0] * size, key[1] * size
+        return max(0, top - row, row - top - size + 1) + max(0, left - col, col - left - size + 1)
+
+    def ring(self, coord, ring):
+        """
+        Keys of nonempty buckets in Chebyshev distance ring from bucket of coord
+        """
+        row, col = self.key(coord)
+        buckets = self.buckets
+        for bucket_row in xrange(max(0, row - ring), min(self.rows, row + ring + 1)):
+            if abs(bucket_row - row) == ring:
+                bucket_cols = xrange(max(0, col - ring), min(self.cols, col + ring + 1))
+            else:
+                bucket_cols = [bucket_col for bucket_col in (col - ring, col + ring) if 0 <= bucket_col < self.cols]
+            for bucket_col in bucket_cols:
+                if (bucket_row, bucket_col) in buckets:
+                    yield (bucket_row, bucket_col)
+
+    def nearest(self, coord, k=2):
+        """
+        k nearest items as sorted list of (distance, item)
+        """
+        found = []
+        for ring in xrange(max(self.rows, self.cols)):
+            if len(found) == k and found[-1][0] < self.ring_bound(ring):
+                break
+            for key in self.ring(coord, ring):
+                for item in self.buckets[key]:
+                    candidate = (calc_distance(coord, self.coords[item]), item)
+                    if len(found) < k or candidate < found[-1]:
+                        found.append(candidate)
+                        found.sort()
+                        del found[k:]
+        return found
+
+class GridWorld(World):
+
+    def __init__(self, width, height, disp_num, cities, rng=random):
+        if (disp_num + len(cities)) > width * height:
+            print "too many cities and dispensers for too small grid"
+            sys.exit(1)
+        self.width = width
+        self.height = height
+        self.cities = cities
+        self.city_coords = [city.get_coord() for city in cities]
+        self.city_index = GridIndex.for_items(height, width, len(cities), CITIES_PER_BUCKET)
+        for city_index, coord in enumerate(self.city_coords):
+            self.city_index.add(city_index, coord)
+        self._init([Disp(coord) for coord in self.sample_free_cells(disp_num, rng)])
+
+    def sample_free_cells(self, num, rng=random):
+        """
+        num distinct cells free of cities (and current dispensers) - by rejection sampling
+        unless the grid is mostly full
+        """
+        occupied = set(self.city_coords)
+        occupied.update(disp.get_coord() for disp in getattr(self, "disps", ()))
+        if 2 * (len(occupied) + num) > self.width * self.height:
+            free = [(row, col) for row in xrange(self.height) for col in xrange(self.width)
+                               if (row, col) not in occupied]
+            return rng.sample(free, num)
+        cells = []
+        while len(cells) < num:
+            cell = (rng.randrange(self.height), rng.randrange(self.width))
+            if cell not in occupied:
+                occupied.add(cell)
+                cells.append(cell)
+        return cells
+
+    def _init(self, disps):
+        self.disps = disps
+        for index, disp in enumerate(self.disps):
+            disp.index = index
+        self.occupied = set(self.city_coords)
+        self.occupied.update(disp.get_coord() for disp in disps)
+        self.disp_index = GridIndex.for_items(self.height, self.width, len(disps), DISPS_PER_BUCKET)
+        for disp in disps:
+            self.disp_index.add(disp.index, disp.get_coord())
+        cities_num = len(self.cities)
+        self.near_dist, self.near_disp = [0] * cities_num, [None] * cities_num
+        self.second_dist, self.second_disp = [0] * cities_num, [None] * cities_num
+        #cities by their nearest and second nearest dispenser
+        self.served = [set() for _ in disps]
+        self.second_served = [set() for _ in disps]
+        self.bounds = {}
+        self.max_bound = 0
+        self.total_distance = 0
+        for city_index in xrange(cities_num):
+            self._rescan_city(city_index)
+        self.moves = 0
+        self._refresh_bounds()
+
+    def plug_in_solution(self, solution):
+        """
+        Moves only the dispensers that differ from solution (restarts of annealing usually
+        differ in few of them), whole init if the moves block each other
+        """
+        if len(solution) != len(self.disps):
+            return World.plug_in_solution(self, solution)
+        pending = [(disp, coord) for disp, coord in zip(self.disps, solution) if disp.get_coord() != coord]
+        while pending:
+            blocked = [(disp, coord) for disp, coord in pending if not self.move_disp(disp, coord)]
+            if len(blocked) == len(pending):
+                return World.plug_in_solution(self, solution)
+            pending = blocked
+
+    def _set_city(self, city_index, near, second):
+        """
+        Sets (distance, disp index) of the nearest and second nearest dispenser of city
+        """
+        if self.near_disp[city_index] is not None:
+            self.served[self.near_disp[city_index]].discard(city_index)
+        if self.second_disp[city_index] is not None:
+            self.second_served[self.second_disp[city_index]].discard(city_index)
+        self.total_distance += near[0] - self.near_dist[city_index]
+        self.near_dist[city_index], self.near_disp[city_index] = near
+        self.second_dist[city_index], self.second_disp[city_index] = second
+        self.served[near[1]].add(city_index)
+        if second[1] is not None:
+            self.second_served[second[1]].add(city_index)
+        key = self.city_index.key(self.city_coords[city_index])
+        if second[0] > self.bounds.get(key, -1):
+            self.bounds[key] = second[0]
+            self.max_bound = max(self.max_bound, second[0])
+
+    def _rescan_city(self, city_index):
+        found = self.disp_index.nearest(self.city_coords[city_index], 2)
+        found.extend([(INFINITY, None)] * (2 - len(found)))
+        self._set_city(city_index, found[0], found[1])
+
+    def _refresh_bounds(self):
+        bounds = {}
+        for key, bucket in self.city_index.buckets.iteritems():
+            bounds[key] = max(self.second_dist[city_index] for city_index in bucket)
+        self.bounds = bounds
+        self.max_bound = max(bounds.values()) if bounds else 0
+
+    def _affected(self, coord):
+        """
+        Cities in buckets where some city may be closer to coord than to its second
+        nearest dispenser
+        """
+        index = self.city_index
+        for ring in xrange(max(index.rows, index.cols)):
+            if index.ring_bound(ring) >= self.max_bound:
+                break
+            for key in index.ring(coord, ring):
+                if index.bucket_bound(coord, key) < self.bounds[key]:
+                    for city_index in index.buckets[key]:
+                        yield city_index
+
+    def move_delta(self, disp, new_disp_coord):
+        """
+        Change of total distance if disp moved to new_disp_coord (None if the coord is occupied).
+        """
+        if new_disp_coord in self.occupied:
+            return None
+        index = disp.index
+        city_coords, near_dist, near_disp, second_dist = \
+            self.city_coords, self.near_dist, self.near_disp, self.second_dist
+        delta = 0
+        for city_index in self.served[index]:
+            new_dist = calc_distance(city_coords[city_index], new_disp_coord)
+            delta += min(new_dist, second_dist[city_index]) - near_dist[city_index]
+        for city_index in self._affected(new_disp_coord):
+            if near_disp[city_index] != index:
+                new_dist = calc_distance(city_coords[city_index], new_disp_coord)
+                if new_dist < near_dist[city_index]:
+                    delta += new_dist - near_dist[city_index]
+        return delta
+
+    def move_disp(self, disp, new_disp_coord):
+        if new_disp_coord in self.occupied:
+            return False
+        self.occupied.remove(disp.get_coord())
+        disp.move(new_disp_coord)
+        self.occupied.add(new_disp_coord)
+        self.disp_index.move(disp.index, new_disp_coord)
+        self._update_nearest(disp.index, new_disp_coord)
+        self.moves += 1
+        if self.moves % REFRESH_FREQ == 0:
+            self._refresh_bounds()
+        return True
+
+    def _update_nearest(self, index, new_disp_coord):
+        city_coords, near_dist, near_disp, second_dist, second_disp = \
+            self.city_coords, self.near_dist, self.near_disp, self.second_dist, self.second_disp
+        for city_index in list(self.served[index]):
+            new_dist = calc_distance(city_coords[city_index], new_disp_coord)
+            if new_dist <= second_dist[city_index]:
+                self._set_city(city_index, (new_dist, index), (second_dist[city_index], second_disp[city_index]))
+            else:
+                self._rescan_city(city_index)
+        for city_index in list(self.second_served[index]):
+            new_dist = calc_distance(city_coords[city_index], new_disp_coord)
+            near = (near_dist[city_index], near_disp[city_index])
+            if (new_dist, index) < near:
+                self._set_city(city_index, (new_dist, index), near)
+            elif new_dist <= second_dist[city_index]:
+                self._set_city(city_index, near, (new_dist, index))
+            else:
+                self._rescan_city(city_index)
+        for city_index in self._affected(new_disp_coord):
+            if near_disp[city_index] == index or second_disp[city_index] == index:
+                continue
+            new_dist = calc_distance(city_coords[city_index], new_disp_coord)
+            near = (near_dist[city_index], near_disp[city_index])
+            if new_dist < near[0]:
+                self._set_city(city_index, (new_dist, index), near)
+            elif new_dist < second_dist[city_index]:
+                self._set_city(city_index, near, (new_dist, index))
+
+    def _calc_total_distance(self):
+        return sum(self.disp_index.nearest(coord, 1)[0][0] for coord in self.city_coords)
+
+    def to_nice_str(self):
+        rows = [bytearray("." * self.width) for _ in xrange(self.height)]
+        for row, col in self.city_coords:
+            rows[row][col] = "P"
+        for disp in self.disps:
+            row, col = disp.get_coord()
+            rows[row][col] = "d"
+        return "".join(str(row) + "\n" for row in rows)
+
+    def __str__(self):
+        return "\n size:%sx%s\n total distance: %d \n cities:%s\n dispensers:%s" % \
+             (self.height, self.width, self.total_distance, len(self.cities), len(self.disps))
+
+    @classmethod
+    def from_file(cls, f, rng=random):
+        """
+        Parses .wld file line by line
+        """
+        size, disp_num = f.readline().split()
+        width, height = size.split("x")
+        cities = []
+        for row, line in enumerate(f):
+            col = line.find("P")
+            while col >= 0:
+                cities.append(City((row, col)))
+                col = line.find("P", col + 1)
+        return cls(int(width), int(height), int(disp_num), cities, rng)
+
+def generate_world(f, width, height, cities_num, disp_num, rng=random):
+    """
+    Writes random .wld file row by row
+    """
+    f.write("%dx%d %d\n" % (width, height, disp_num))
+    cities = sorted(divmod(cell, width) for cell in rng.sample(xrange(width * height), cities_num))
+    next_city = 0
+    for row in xrange(height):
+        line = bytearray("." * width)
+        while next_city < len(cities) and cities[next_city][0] == row:
+            line[cities[next_city][1]] = "P"
+            next_city += 1
+        f.write(str(line) + "\n")
+
+def search(fp, iters=10000):
+    f = open(fp, "r")
+    try:
+        world = GridWorld.from_file(f)
+    finally:
+        f.close()
+    print "running search on world: %s" % world
+    stats = anneal(world, iters, 25, metrics_freq=max(iters / 10, 1), callback=print_metrics)
+    world.plug_in_solution(stats["best_solution"])
+    print "best fitness: %s" % world.get_fitness()
+
+if __name__ == '__main__':
+    search(sys.argv[1], len(sys.argv) > 2 and int(sys.argv[2]) or 10000)
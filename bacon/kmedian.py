@@ -0,0 +1,162 @@
+"""
+Bounded solver mode for proggitquiz 4 - the problem is k-medians (p-median) under
+Manhattan distance with dispensers restricted to free cells.
+
+    * greedy farthest-point initial solution (also usable to seed annealing)
+    * Lloyd iterations and swap local search over precomputed city-to-cell distance tables
+    * Lagrangian lower bound, which gives the optimality gap of the found solution
+"""
+
+import sys
+import random
+from math import ceil
+
+from bacon import World, calc_distance
+
+def free_cells(world):
+    cities_coords = set(world.city_coords)
+    return [(row, col) for row in xrange(world.height) for col in xrange(world.width)
+                       if (row, col) not in cities_coords]
+
+def cell_distances(world):
+    """
+    For every free cell distances to all the cities (in world.cities order)
+    """
+    return dict((cell, [calc_distance(cell, coord) for coord in world.city_coords])
+                for cell in free_cells(world))
+
+def farthest_point_solution(world, table, rng=random):
+    """
+    First dispenser goes to the 1-median cell, every next one to the free cell closest
+    to the city farthest from the dispensers placed so far.
+    """
+    cells = table.keys()
+    solution = [min(cells, key=lambda cell: sum(table[cell]))]
+    nearest = list(table[solution[0]])
+    while len(solution) < len(world.disps):
+        city_index = max(xrange(len(nearest)), key=lambda j: (nearest[j], rng.random()))
+        taken = set(solution)
+        cell = min((cell for cell in cells if cell not in taken), key=lambda cell: table[cell][city_index])
+        solution.append(cell)
+        nearest = map(min, nearest, table[cell])
+    return solution
+
+def move_delta(world, table, disp_index, cell):
+    """
+    Same as world.move_delta, but with distances looked up in the table
+    """
+    near_dist, near_disp, second_dist = world.near_dist, world.near_disp, world.second_dist
+    delta = 0
+    for city_index, dist in enumerate(table[cell]):
+        if near_disp[city_index] == disp_index:
+            delta += min(dist, second_dist[city_index]) - near_dist[city_index]
+        elif dist < near_dist[city_index]:
+            delta += dist - near_dist[city_index]
+    return delta
+
+def lloyd(world, table, max_rounds=100):
+    """
+    Moves every dispenser to the best cell for cities it serves until nothing changes
+    """
+    for _ in xrange(max_rounds):
+        moved = False
+        for disp in world.disps:
+            cluster = [j for j, index in enumerate(world.near_disp) if index == disp.index]
+            if not cluster:
+                continue
+            cell = min((cell for cell in table if cell not in world.occupied),
+                       key=lambda cell: sum(table[cell][j] for j in cluster))
+            if move_delta(world, table, disp.index, cell) < 0:
+                world.move_disp(disp, cell)
+                moved = True
+        if not moved:
+            break
+
+def local_search(world, table):
+    """
+    Relocates dispensers (swap dispenser with a free cell) while it improves total distance.
+    Ends in a swap local optimum.
+    """
+    improved = True
+    while improved:
+        improved = False
+        for disp in world.disps:
+            best_delta, best_cell = 0, None
+            for cell in table:
+                if cell in world.occupied:
+                    continue
+                delta = move_delta(world, table, disp.index, cell)
+                if delta < best_delta:
+                    best_delta, best_cell = delta, cell
+            if best_cell:
+                world.move_disp(disp, best_cell)
+                improved = True
+
+def lower_bound(world, table, upper_bound, iters=200):
+    """
+    Lagrangian relaxation of assignment constraints of p-median, maximized by subgradient method:
+        L(lambda) = sum_j lambda_j + sum of p smallest rho_i,  rho_i = sum_j min(0, d_ij - lambda_j)
+    Every L(lambda) is a lower bound of the optimal total distance.
+    """
+    cells = table.keys()
+    disps_num = len(world.disps)
+    cities_num = len(world.city_coords)
+    #start with distances to the second nearest cell
+    lambdas = [float(sorted(table[cell][j] for cell in cells)[min(1, len(cells) - 1)]) for j in xrange(cities_num)]
+    best = 0.0
+    step_scale = 2.0
+    no_improvement = 0
+    for _ in xrange(iters):
+        rhos = [(sum(min(0, dist - lam) for dist, lam in zip(table[cell], lambdas)), cell) for cell in cells]
+        chosen = sorted(rhos)[:disps_num]
+        bound = sum(lambdas) + sum(rho for rho, cell in chosen)
+        if bound > best + 1e-9:
+            best = bound
+            no_improvement = 0
+        else:
+            no_improvement += 1
+            if no_improvement >= 5:
+                step_scale /= 2
+                no_improvement = 0
+        #subgradient - how many times is each city covered by chosen cells
+        subgradient = [1] * cities_num
+        for rho, cell in chosen:
+            for j, (dist, lam) in enumerate(zip(table[cell], lambdas)):
+                if dist < lam:
+                    subgradient[j] -= 1
+        norm = sum(g * g for g in subgradient)
+        if norm == 0 or step_scale < 1e-4:
+            break
+        step = step_scale * (upper_bound - bound) / norm
+        lambdas = [max(0.0, lam + step * g) for lam, g in zip(lambdas, subgradient)]
+    #distances are integers
+    return int(ceil(best - 1e-6))
+
+def solve(world, rng=random):
+    """
+    Farthest-point start, Lloyd and swap local search, then lower bound.
+    Returns stats with the fitness, lower bound and optimality gap, world holds the solution.
+    """
+    table = cell_distances(world)
+    world.plug_in_solution(farthest_point_solution(world, table, rng))
+    initial_fitness = world.get_fitness()
+    lloyd(world, table)
+    local_search(world, table)
+    fitness = world.get_fitness()
+    bound = lower_bound(world, table, fitness)
+    return {
+            "initial_fitness": initial_fitness,
+            "fitness": fitness,
+            "lower_bound": bound,
+            "gap": fitness and float(fitness - bound) / fitness,
+           }
+
+def search(fp):
+    world = World.from_lines(open(fp, "r").readlines())
+    stats = solve(world)
+    print "initial fitness: %s" % stats["initial_fitness"]
+    print "fitness: %s lower bound: %s gap: %.1f%%" % (stats["fitness"], stats["lower_bound"], 100 * stats["gap"])
+    print world.to_nice_str(), world.get_fitness()
+
+if __name__ == '__main__':
+    search(sys.argv[1])
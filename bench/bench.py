@@ -0,0 +1,260 @@
+"""
+Benchmarks of the fun projects - seeded, parameterized workloads with JSON results.
+
+    bench.py [-q] [-s SEED] [-o results.json] [--profile DIR] [--memory] [workload ...]
+    bench.py compare old.json new.json
+
+Workloads:
+    bloom          build and query rate of BloomFilter, measured false positive rate
+    word_chains    word graph build time and chain queries per second
+    bacon          annealing iterations per second and fitness over time
+    hawks_and_doves  rounds per second of Pop, exact and batched ArrayPop
+    word_search    puzzles per second
+
+Every workload draws from its own random.Random(seed) (global random and numpy random
+are seeded too for code that uses them), so runs at the same commit do the same work.
+With --profile every workload runs under cProfile and the stats are dumped to DIR,
+--memory records peak traced memory (tracemalloc) or peak RSS where tracemalloc is missing.
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for project in ["bloom", "word_chains", "bacon", "hawks_and_doves", "word_search"]:
+    sys.path.insert(0, os.path.join(ROOT, project))
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SEED = 0
+
+def _random_keys(rng, num, size=10):
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(alphabet) for _ in xrange(size)) for _ in xrange(num)]
+
+def bench_bloom(rng, capacity=200000, fp_rate=0.01, queries=50000):
+    import bloom
+    keys = _random_keys(rng, capacity)
+    t = time.time()
+    bf = bloom.BloomFilter.for_capacity(capacity, fp_rate)
+    bf.insert_many(keys)
+    build_time = time.time() - t
+    t = time.time()
+    assert bf.contains_many(keys[:queries]).all()
+    query_time = time.time() - t
+    return {
+            "build_keys_per_sec": capacity / build_time,
+            "query_keys_per_sec": min(queries, capacity) / query_time,
+            "measured_fp_rate": bloom.stress_test(12, queries, bf, rng, verbose=False),
+            "estimated_fp_rate": bf.estimated_fp_rate(),
+           }
+
+def bench_word_chains(rng, queries=200, word_len=5, processes=None):
+    import wc
+    t = time.time()
+    f = open(os.path.join(ROOT, "word_chains", wc.WORDS_FN), "r")
+    try:
+        compact_dict = wc.CompactDict.from_file(f)
+    finally:
+        f.close()
+    load_time = time.time() - t
+    t = time.time()
+    graph = wc.WordGraph.from_compact_dict(compact_dict, processes=processes)
+    build_time = time.time() - t
+    words = list(compact_dict.words(word_len))
+    pairs = [(rng.choice(words), rng.choice(words)) for _ in xrange(queries)]
+    t = time.time()
+    chains = graph.find_chains(pairs)
+    query_time = time.time() - t
+    found = [chain for chain in chains if chain]
+    return {
+            "load_sec": load_time,
+            "build_sec": build_time,
+            "queries_per_sec": queries / query_time,
+            "found_ratio": float(len(found)) / queries,
+            "mean_chain_len": found and float(sum(len(chain) for chain in found)) / len(found),
+           }
+
+def bench_bacon(rng, world="medium.wld", iters=5000, metrics_freq=500):
+    import bacon
+    f = open(os.path.join(ROOT, "bacon", "data", world), "r")
+    try:
+        world = bacon.World.from_lines(f.readlines(), rng)
+    finally:
+        f.close()
+    stats = {}
+    start_fitness = world.get_fitness()
+    t = time.time()
+    trace = [{"iter": metrics["iter"], "best_fitness": metrics["best_fitness"], "fitness": metrics["fitness"]}
+             for metrics in bacon.anneal_metrics(world, iters, 25, rng=rng, metrics_freq=metrics_freq, stats=stats)]
+    seconds = time.time() - t
+    return {
+            "iters_per_sec": iters / seconds,
+            "start_fitness": start_fitness,
+            "best_fitness": stats["best_fitness"],
+            "fitness_over_time": trace,
+           }
+
+def bench_hawks_and_doves(rng, pop_size=1000, rounds=5000, batched_rounds=200000, batch_size=100):
+    import had
+    from array_pop import ArrayPop
+    config = had.Config(pop_size=pop_size, rounds=rounds, species={had.Hawk: 0.5, had.Dove: 0.5})
+    #had uses the global random
+    random.seed(rng.getrandbits(32))
+    results = {}
+    for name, pop in [("pop", had.Pop(config.species, pop_size, config)),
+                      ("array_pop", ArrayPop(config.species, pop_size, config=config))]:
+        t = time.time()
+        for _ in xrange(rounds):
+            pop.perform_fight()
+            pop.update_ages()
+            if config.evo_replace_prob > random.random():
+                pop.perform_evo_replace()
+        results["%s_rounds_per_sec" % name] = rounds / (time.time() - t)
+    pop = ArrayPop(config.species, pop_size, rng.getrandbits(32), config)
+    t = time.time()
+    while pop.round < batched_rounds:
+        pop.perform_fights(min(batch_size, batched_rounds - pop.round))
+    results["batched_rounds_per_sec"] = batched_rounds / (time.time() - t)
+    results["batched_hawk_ratio"] = float(pop.representants[had.Hawk]) / pop_size
+    return results
+
+def bench_word_search(rng, puzzles=10, edge=10):
+    import wordsearch
+    f = open(os.path.join(ROOT, "word_search", wordsearch.LIST), "r")
+    try:
+        words = [line.strip() for line in f]
+    finally:
+        f.close()
+    empty = 0
+    t = time.time()
+    for _ in xrange(puzzles):
+        puzzle, placed = wordsearch.make_puzzle(edge, words, random.Random(rng.getrandbits(32)))
+        empty += puzzle.count(wordsearch.ANY)
+    return {
+            "puzzles_per_sec": puzzles / (time.time() - t),
+            "mean_empty_cells": float(empty) / puzzles,
+           }
+
+#name, function, default params, quick params
+WORKLOADS = [
+             ("bloom", bench_bloom, {}, {"capacity": 20000, "queries": 5000}),
+             ("word_chains", bench_word_chains, {}, {"queries": 50}),
+             ("bacon", bench_bacon, {}, {"world": "small.wld", "iters": 1000, "metrics_freq": 100}),
+             ("hawks_and_doves", bench_hawks_and_doves, {}, {"rounds": 1000, "batched_rounds": 20000}),
+             ("word_search", bench_word_search, {}, {"puzzles": 3}),
+            ]
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_workload(name, func, params, seed=SEED, profile_dir=None, memory=False):
+    rng = random.Random(seed)
+    random.seed(seed)
+    numpy.random.seed(seed)
+    if memory and tracemalloc:
+        tracemalloc.start()
+    profiler = profile_dir and cProfile.Profile()
+    t = time.time()
+    if profiler:
+        metrics = profiler.runcall(func, rng, **params)
+    else:
+        metrics = func(rng, **params)
+    result = {"params": params, "seconds": time.time() - t, "metrics": metrics}
+    if profiler:
+        path = os.path.join(profile_dir, "%s.prof" % name)
+        profiler.dump_stats(path)
+        result["profile"] = path
+    if memory:
+        if tracemalloc:
+            result["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            #process high water mark - includes the workloads run before
+            result["max_rss_kb"] = _max_rss_kb()
+    return result
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT,
+                                       stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(names=None, seed=SEED, quick=False, profile_dir=None, memory=False):
+    results = {
+               "commit": _git_commit(),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "seed": seed,
+               "quick": quick,
+               "workloads": {},
+              }
+    if profile_dir and not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    for name, func, params, quick_params in WORKLOADS:
+        if names and name not in names:
+            continue
+        print "running %s" % name
+        result = run_workload(name, func, quick and quick_params or params, seed, profile_dir, memory)
+        results["workloads"][name] = result
+        print "  %.2fs %s" % (result["seconds"], ", ".join("%s: %.4g" % (key, value) for key, value in
+                              sorted(result["metrics"].items()) if isinstance(value, (int, float))))
+    return results
+
+def compare(old, new):
+    """
+    Prints numeric metrics of workloads in both results with new / old ratio
+    """
+    for name in sorted(set(old["workloads"]) & set(new["workloads"])):
+        old_metrics, new_metrics = old["workloads"][name]["metrics"], new["workloads"][name]["metrics"]
+        print "%s (%s -> %s)" % (name, old.get("commit"), new.get("commit"))
+        for key in sorted(set(old_metrics) & set(new_metrics)):
+            old_value, new_value = old_metrics[key], new_metrics[key]
+            if not isinstance(old_value, (int, float)) or not isinstance(new_value, (int, float)):
+                continue
+            ratio = old_value and "%.3fx" % (float(new_value) / old_value) or "-"
+            print "  %-28s %12.4g %12.4g %8s" % (key, old_value, new_value, ratio)
+
+def _load(path):
+    f = open(path, "r")
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare(_load(sys.argv[2]), _load(sys.argv[3]))
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="benchmarks of the fun projects")
+    parser.add_argument("workloads", nargs="*", help="workloads to run (all by default): %s" %
+                        ", ".join(name for name, func, params, quick_params in WORKLOADS))
+    parser.add_argument("-s", "--seed", type=int, default=SEED)
+    parser.add_argument("-q", "--quick", action="store_true", help="small workloads")
+    parser.add_argument("-o", "--output", default="bench.json", help="JSON results file")
+    parser.add_argument("--profile", metavar="DIR", help="dump cProfile stats of workloads to DIR")
+    parser.add_argument("--memory", action="store_true", help="record peak memory of workloads")
+    args = parser.parse_args()
+    results = run(args.workloads, args.seed, args.quick, args.profile, args.memory)
+    f = open(args.output, "w")
+    try:
+        json.dump(results, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+    print "results written to %s" % args.output
@@ -4,72 +4,596 @@ Bloom filter implementation
 
 from bitarray import bitarray
 from hashlib import md5
+from itertools import islice
+from math import ceil, log
+from multiprocessing import Pool
+import numpy
+import os
 import random
+import struct
+import sys
+import threading
 import time
-import psyco
-psyco.full()
+try:
+    import psyco
+    psyco.full()
+except ImportError:
+    pass
 
-class HashGenerator(object):
+MASK_64 = (1 << 64) - 1
+_DIGEST_HALVES = struct.Struct("<QQ")
+#bit masks within a byte - same (big endian) layout as bitarray uses by default
+_BIT_MASKS = numpy.array([0x80 >> i for i in xrange(8)], dtype=numpy.uint8)
+#number of set bits for every byte value
+_POPCOUNT = numpy.array([bin(i).count("1") for i in xrange(256)], dtype=numpy.uint8)
+
+class HashStrategy(object):
     """
-    For given key generates hashes_num into hash_area_size
+    Common base of hash strategies - for given key generates hashes_num indices into hash_area_size
     """
+    name = None
     base_SIZE = 5
-    def __init__(self, hashes_num, hash_area_size):
+
+    def gen_hashes(self, key):
+        raise NotImplementedError
+
+    def gen_hashes_many(self, keys):
+        """
+        Hashes for a batch of keys as a len(keys) x hashes_num array
+        """
+        hashes = numpy.array([self.gen_hashes(key) for key in keys], dtype=numpy.uint64)
+        return hashes.reshape(len(keys), self.hashes_num)
+
+    def _gen_seed(self):
+        return "".join([chr(97 + random.randint(0, 25)) for i in xrange(self.base_SIZE)])
+
+    def _gen_base(self, seed):
+        return md5(seed)
+
+    def __reduce__(self):
+        #md5 objects can't be pickled, seeds are enough to rebuild them
+        return (self.__class__, (self.hashes_num, self.hash_area_size, self.seeds))
+
+    def __eq__(self, other):
+        return (self.__class__ == other.__class__ and self.hashes_num == other.hashes_num
+                and self.hash_area_size == other.hash_area_size and self.seeds == other.seeds)
+
+    def __ne__(self, other):
+        return not self == other
+
+class HashGenerator(HashStrategy):
+    """
+    Original strategy - one salted md5 digest per hash function
+    """
+    name = "md5"
+    def __init__(self, hashes_num, hash_area_size, seeds=None):
+        self.hashes_num = hashes_num
         self.hash_area_size = hash_area_size
-        self.bases = [self._gen_base() for i in xrange(hashes_num)]
+        self.seeds = seeds or [self._gen_seed() for i in xrange(hashes_num)]
+        assert(len(self.seeds) == hashes_num)
+        self.bases = [self._gen_base(seed) for seed in self.seeds]
         #print self.bases
 
     def gen_hashes(self, key):
         assert(type(key) == str)
         return [self._gen_hash(key, base) for base in self.bases]
 
-    def _gen_base(self):
-        return md5("".join([chr(97 + random.randint(0, 25)) for i in xrange(self.base_SIZE)]))
-
     def _gen_hash(self, key, base):
         hash = base.copy()
         hash.update(key)
         return int(int(hash.hexdigest(), 16) % self.hash_area_size)
 
+class DoubleHashGenerator(HashStrategy):
+    """
+    Kirsch-Mitzenmacher double hashing.
+
+    Single 128 bit digest is computed per key and split into two 64 bit halves h1, h2.
+    i-th index is then (h1 + i * h2) mod hash_area_size - no need for k digests.
+    """
+    name = "double"
+    def __init__(self, hashes_num, hash_area_size, seeds=None):
+        self.hashes_num = hashes_num
+        self.hash_area_size = hash_area_size
+        self.seeds = seeds or [self._gen_seed()]
+        assert(len(self.seeds) == 1)
+        self.base = self._gen_base(self.seeds[0])
+
+    def gen_hashes(self, key):
+        assert(type(key) == str)
+        hash = self.base.copy()
+        hash.update(key)
+        h1, h2 = _DIGEST_HALVES.unpack(hash.digest())
+        #odd h2 never degenerates to the same index for all i
+        h2 |= 1
+        size = self.hash_area_size
+        return [((h1 + i * h2) & MASK_64) % size for i in xrange(self.hashes_num)]
+
+    def gen_hashes_many(self, keys):
+        digests = []
+        for key in keys:
+            hash = self.base.copy()
+            hash.update(key)
+            digests.append(hash.digest())
+        halves = numpy.frombuffer("".join(digests), dtype="<u8").reshape(-1, 2)
+        h1, h2 = halves[:, :1], halves[:, 1:] | numpy.uint64(1)
+        #uint64 arithmetic wraps around exactly like the & MASK_64 in gen_hashes
+        steps = numpy.arange(self.hashes_num, dtype=numpy.uint64)
+        return (h1 + steps * h2) % numpy.uint64(self.hash_area_size)
+
+#selectable hash strategies by name
+HASH_STRATEGIES = dict((cls.name, cls) for cls in [HashGenerator, DoubleHashGenerator])
+
+def optimal_params(capacity, fp_rate):
+    """
+    Returns (size, hashes_num) minimizing memory of filter holding capacity keys with given fp_rate
+    """
+    assert(capacity > 0 and 0 < fp_rate < 1)
+    size = int(ceil(-capacity * log(fp_rate) / log(2) ** 2))
+    hashes_num = max(1, int(round(float(size) / capacity * log(2))))
+    return size, hashes_num
+
+def _key_batches(key_gen, batch_size):
+    key_gen = iter(key_gen)
+    while True:
+        keys = [key.strip() for key in islice(key_gen, batch_size)]
+        if not keys:
+            break
+        yield keys
+
+#on-disk format: header, hash seeds, raw filter bytes
+FILE_MAGIC = "BLMF"
+FILE_VERSION = 1
+#magic, version, strategy name, size, hashes num, seeds num, seed size
+_FILE_HEADER = struct.Struct("<4sH8sQIII")
+
 class BloomFilter(object):
-    def __init__(self, size, hash_gen):
+    """
+    Bits are kept packed in a numpy byte array, bit i is the (i % 8)-th most significant bit of byte i / 8
+    """
+    BATCH_SIZE = 65536
+
+    def __init__(self, size, hash_gen=None, filter=None):
+        if hash_gen is None:
+            hash_gen = DoubleHashGenerator(HASH_FUNCS_NUM, size)
         self.hash_gen = hash_gen 
-        self.filter = bitarray([0] * size) 
+        self.size = size
+        if filter is None:
+            filter = numpy.zeros((size + 7) / 8, dtype=numpy.uint8)
+        assert(len(filter) == (size + 7) / 8)
+        self.filter = filter
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate, hash_gen_cls=DoubleHashGenerator):
+        """
+        Filter with optimal size and number of hash functions for capacity keys
+        """
+        size, hashes_num = optimal_params(capacity, fp_rate)
+        return cls(size, hash_gen_cls(hashes_num, size))
+
+    @classmethod
+    def from_bitarray(cls, bits, hash_gen):
+        bf = cls(len(bits), hash_gen)
+        if bits.endian() != "big":
+            bits = bitarray(bits, endian="big")
+        bf.filter[:] = numpy.frombuffer(bits.tobytes(), dtype=numpy.uint8)
+        return bf
+
+    def to_bitarray(self):
+        bits = bitarray(endian="big")
+        bits.frombytes(self.filter.tostring())
+        return bits[:self.size]
+
+    def save(self, path):
+        """
+        Stores filter in versioned binary format, see open()
+        """
+        hash_gen = self.hash_gen
+        seed_size = hash_gen.base_SIZE
+        assert(all(len(seed) == seed_size for seed in hash_gen.seeds))
+        f = open(path, "wb")
+        try:
+            f.write(_FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, hash_gen.name, self.size,
+                                      hash_gen.hashes_num, len(hash_gen.seeds), seed_size))
+            f.write("".join(hash_gen.seeds))
+            self.filter.tofile(f)
+        finally:
+            f.close()
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """
+        Opens filter stored by save(). Bits are memory mapped - nothing is copied or rehashed.
+
+        mode is as in numpy.memmap: "r" read only (can be shared by many processes),
+        "r+" inserts are written through to the file, "c" copy on write
+        """
+        f = open(path, "rb")
+        try:
+            header = f.read(_FILE_HEADER.size)
+            if len(header) != _FILE_HEADER.size:
+                raise ValueError("%s: truncated bloom filter header" % path)
+            magic, version, strategy, size, hashes_num, seeds_num, seed_size = _FILE_HEADER.unpack(header)
+            if magic != FILE_MAGIC:
+                raise ValueError("%s: not a bloom filter file" % path)
+            if version != FILE_VERSION:
+                raise ValueError("%s: unsupported bloom filter file version %d" % (path, version))
+            seeds_blob = f.read(seeds_num * seed_size)
+        finally:
+            f.close()
+        seeds = [seeds_blob[i:i + seed_size] for i in xrange(0, len(seeds_blob), seed_size)]
+        hash_gen = HASH_STRATEGIES[strategy.rstrip("\0")](hashes_num, size, seeds)
+        filter = numpy.memmap(path, dtype=numpy.uint8, mode=mode,
+                              offset=_FILE_HEADER.size + len(seeds_blob), shape=((size + 7) / 8,))
+        return cls(size, hash_gen, filter)
+
+    def flush(self):
+        """
+        Writes changes of filter opened in "r+" mode to disk
+        """
+        if isinstance(self.filter, numpy.memmap):
+            self.filter.flush()
 
     def from_key_gen(self, key_gen):
-        for key in key_gen:
-            self.insert(key.strip())
+        for keys in _key_batches(key_gen, self.BATCH_SIZE):
+            self.insert_many(keys)
+
+    def compatible(self, other):
+        """
+        Only filters of the same size and hash functions can be merged
+        """
+        return self.size == other.size and self.hash_gen == other.hash_gen
+
+    def _merge(self, other, op):
+        if not self.compatible(other):
+            raise ValueError("can't merge bloom filters with different parameters")
+        return self._with_filter(op(self.filter, other.filter))
+
+    def _with_filter(self, filter):
+        """
+        Filter of the same class and parameters with bits filter
+        """
+        return self.__class__(self.size, self.hash_gen, filter)
+
+    def union(self, other):
+        """
+        Filter containing keys of both filters - same as if all the keys were inserted to one filter
+        """
+        return self._merge(other, numpy.bitwise_or)
+
+    def intersection(self, other):
+        """
+        Filter containing keys present in both filters - fp rate may be higher than of filter built from the common keys
+        """
+        return self._merge(other, numpy.bitwise_and)
+
+    __or__ = union
+    __and__ = intersection
+
+    def update(self, other):
+        """
+        In place union
+        """
+        if not self.compatible(other):
+            raise ValueError("can't merge bloom filters with different parameters")
+        self.filter |= other.filter
 
     def insert(self, key):
         for index in self.hash_gen.gen_hashes(key):
-            assert(index < len(self.filter))
-            self.filter[index] = 1
+            assert(index < self.size)
+            self.filter[index >> 3] |= _BIT_MASKS[index & 7]
+
+    def contains(self, key):
+        for index in self.hash_gen.gen_hashes(key):
+            if not self.filter[index >> 3] & _BIT_MASKS[index & 7]:
+                return False
+        return True
+
+    def insert_many(self, keys):
+        indices = self.hash_gen.gen_hashes_many(keys).ravel()
+        byte_indices, bit_indices = indices >> numpy.uint64(3), indices & numpy.uint64(7)
+        #one pass per bit position - duplicate byte indices within a pass set the very same bit
+        for bit in xrange(8):
+            self.filter[byte_indices[bit_indices == bit]] |= _BIT_MASKS[bit]
+
+    def contains_many(self, keys):
+        """
+        Returns bool array, one item for each key
+        """
+        indices = self.hash_gen.gen_hashes_many(keys)
+        present = self.filter[indices >> numpy.uint64(3)] & _BIT_MASKS[indices & numpy.uint64(7)]
+        return present.all(axis=1)
+
+    def fill_ratio(self):
+        return float(_POPCOUNT[self.filter].sum()) / self.size
+
+    def estimated_fp_rate(self):
+        """
+        Probability of false positive given the current fill ratio
+        """
+        return self.fill_ratio() ** self.hash_gen.hashes_num
+
+class ScalableBloomFilter(object):
+    """
+    Scalable bloom filter (Almeida et al.) - chain of bloom filters for unknown number of keys.
+
+    Every new sub-filter has growth times the capacity of the previous one and its fp rate
+    is tightened by tightening ratio, so the compound fp rate never exceeds fp_rate:
+        fp_rate * (1 - tightening) * (1 + tightening + tightening^2 + ...) < fp_rate
+    """
+    def __init__(self, initial_capacity, fp_rate, growth=2, tightening=0.85, hash_gen_cls=DoubleHashGenerator):
+        self.initial_capacity = initial_capacity
+        self.fp_rate = fp_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.hash_gen_cls = hash_gen_cls
+        #sub-filters and number of keys inserted to each of them
+        self.filters = []
+        self.counts = []
+        self._add_filter()
+
+    @property
+    def size(self):
+        return sum(bf.size for bf in self.filters)
+
+    def _add_filter(self):
+        i = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** i
+        fp_rate = self.fp_rate * (1 - self.tightening) * self.tightening ** i
+        self.filters.append(BloomFilter.for_capacity(capacity, fp_rate, self.hash_gen_cls))
+        self.counts.append(0)
+
+    def _capacity_left(self):
+        return self.initial_capacity * self.growth ** (len(self.filters) - 1) - self.counts[-1]
+
+    def from_key_gen(self, key_gen):
+        for keys in _key_batches(key_gen, BloomFilter.BATCH_SIZE):
+            self.insert_many(keys)
+
+    def insert(self, key):
+        #keys already present would only waste capacity
+        if self.contains(key):
+            return
+        if self._capacity_left() <= 0:
+            self._add_filter()
+        self.filters[-1].insert(key)
+        self.counts[-1] += 1
+
+    def insert_many(self, keys):
+        keys = list(set(keys))
+        keys = [key for key, present in zip(keys, self.contains_many(keys)) if not present]
+        while keys:
+            if self._capacity_left() <= 0:
+                self._add_filter()
+            chunk, keys = keys[:self._capacity_left()], keys[self._capacity_left():]
+            self.filters[-1].insert_many(chunk)
+            self.counts[-1] += len(chunk)
+
+    def contains(self, key):
+        #recent filters are the biggest ones
+        return any(bf.contains(key) for bf in reversed(self.filters))
+
+    def contains_many(self, keys):
+        present = numpy.zeros(len(keys), dtype=bool)
+        for bf in self.filters:
+            present |= bf.contains_many(keys)
+        return present
+
+    def estimated_fp_rate(self):
+        return 1 - numpy.prod([1 - bf.estimated_fp_rate() for bf in self.filters])
+
+class ShardedBloomFilter(BloomFilter):
+    """
+    Bloom filter safe for concurrent inserts from many threads.
+
+    Bit space is partitioned into shards_num segments, each guarded by its own lock, so writers
+    touching different segments don't block each other. Reads need no locking as bits only ever
+    go from 0 to 1.
+    """
+    SHARDS_NUM = 16
+
+    def __init__(self, size, hash_gen=None, filter=None, shards_num=SHARDS_NUM):
+        BloomFilter.__init__(self, size, hash_gen, filter)
+        self.shard_size = (len(self.filter) + shards_num - 1) / shards_num
+        self.locks = [threading.Lock() for i in xrange(shards_num)]
+
+    def _with_filter(self, filter):
+        return ShardedBloomFilter(self.size, self.hash_gen, filter, len(self.locks))
+
+    def update(self, other):
+        """
+        In place union, each shard under its lock
+        """
+        if not self.compatible(other):
+            raise ValueError("can't merge bloom filters with different parameters")
+        for shard, lock in enumerate(self.locks):
+            start, end = shard * self.shard_size, (shard + 1) * self.shard_size
+            with lock:
+                self.filter[start:end] |= other.filter[start:end]
+
+    def insert(self, key):
+        self.insert_many([key])
+
+    def insert_many(self, keys):
+        indices = self.hash_gen.gen_hashes_many(keys).ravel()
+        byte_indices, bit_indices = indices >> numpy.uint64(3), indices & numpy.uint64(7)
+        shards = byte_indices / numpy.uint64(self.shard_size)
+        for shard in numpy.unique(shards):
+            in_shard = shards == shard
+            shard_bytes, shard_bits = byte_indices[in_shard], bit_indices[in_shard]
+            #|= on numpy items is read-modify-write, concurrent writers would lose bits
+            with self.locks[shard]:
+                for bit in xrange(8):
+                    self.filter[shard_bytes[shard_bits == bit]] |= _BIT_MASKS[bit]
+
+class CountingBloomFilter(object):
+    """
+    Bloom filter supporting removal of keys.
+
+    Each position holds 4 bit counter instead of a bit, two counters are packed in a byte
+    (even position in the high nibble). Counters saturate at 15 and saturated counters are
+    never decremented, so removal can't introduce false negatives.
+    """
+    MAX_COUNT = 15
+
+    def __init__(self, size, hash_gen=None):
+        if hash_gen is None:
+            hash_gen = DoubleHashGenerator(HASH_FUNCS_NUM, size)
+        self.hash_gen = hash_gen
+        self.size = size
+        self.counters = numpy.zeros((size + 1) / 2, dtype=numpy.uint8)
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate, hash_gen_cls=DoubleHashGenerator):
+        size, hashes_num = optimal_params(capacity, fp_rate)
+        return cls(size, hash_gen_cls(hashes_num, size))
+
+    def from_key_gen(self, key_gen):
+        for keys in _key_batches(key_gen, BloomFilter.BATCH_SIZE):
+            self.insert_many(keys)
+
+    def _get(self, indices):
+        shifts = (numpy.uint8(1) - (indices & numpy.uint64(1)).astype(numpy.uint8)) * numpy.uint8(4)
+        return (self.counters[indices >> numpy.uint64(1)] >> shifts) & numpy.uint8(0xF)
+
+    def _set(self, indices, values):
+        """
+        indices must be unique
+        """
+        #high and low nibbles separately - a byte must not be assigned twice in one go
+        for parity, shift in [(0, 4), (1, 0)]:
+            sel = (indices & numpy.uint64(1)) == parity
+            byte_indices = indices[sel] >> numpy.uint64(1)
+            kept = self.counters[byte_indices] & numpy.uint8(0xF0 >> shift)
+            self.counters[byte_indices] = kept | (values[sel].astype(numpy.uint8) << numpy.uint8(shift))
+
+    def _update(self, keys, delta):
+        indices, counts = numpy.unique(self.hash_gen.gen_hashes_many(keys), return_counts=True)
+        current = self._get(indices).astype(numpy.int64)
+        values = numpy.clip(current + delta * counts, 0, self.MAX_COUNT)
+        values[current == self.MAX_COUNT] = self.MAX_COUNT
+        self._set(indices, values)
+
+    def insert(self, key):
+        self.insert_many([key])
+
+    def insert_many(self, keys):
+        self._update(keys, 1)
+
+    def remove(self, key):
+        self.remove_many([key])
+
+    def remove_many(self, keys):
+        """
+        Raises KeyError if any of the keys is not present
+        """
+        present = self.contains_many(keys)
+        if not present.all():
+            raise KeyError(keys[numpy.argmin(present)])
+        self._update(keys, -1)
 
     def contains(self, key):
-        return all([self.filter[index] for index in self.hash_gen.gen_hashes(key)])
+        indices = numpy.array(self.hash_gen.gen_hashes(key), dtype=numpy.uint64)
+        return bool(self._get(indices).all())
+
+    def contains_many(self, keys):
+        indices = self.hash_gen.gen_hashes_many(keys)
+        return self._get(indices).all(axis=1)
+
+    def to_bloom_filter(self):
+        """
+        Plain bloom filter with the same keys (e.g. to save it)
+        """
+        bits = numpy.zeros(self.size + (-self.size) % 8, dtype=numpy.uint8)
+        bits[:self.size] = self._get(numpy.arange(self.size, dtype=numpy.uint64)) > 0
+        return BloomFilter(self.size, self.hash_gen, numpy.packbits(bits))
+
+def _build_filter(args):
+    size, hash_gen, keys = args
+    bf = BloomFilter(size, hash_gen)
+    bf.insert_many(keys)
+    return bf.filter
+
+def build_in_pool(key_chunks, size, hash_gen, processes=None):
+    """
+    Builds filter for every chunk of keys in a process pool and merges them into one
+    """
+    pool = Pool(processes)
+    try:
+        bf = BloomFilter(size, hash_gen)
+        for filter in pool.imap_unordered(_build_filter, [(size, hash_gen, keys) for keys in key_chunks]):
+            bf.update(BloomFilter(size, hash_gen, filter))
+    finally:
+        pool.close()
+        pool.join()
+    return bf
 
 FILTER_SIZE = 1000000
 HASH_FUNCS_NUM = 1 
+BENCH_HASH_FUNCS_NUM = 7
+FP_RATE = 0.01
+WORDS_FN = "/usr/share/dict/cracklib-small"
+FILTER_FN = "cracklib-small.%s.bloom"
 
-def stress_test(words_size, iterations, bloom_filter):
+def stress_test(words_size, iterations, bloom_filter, rng=random, verbose=True):
     alphabet = map(chr, xrange(97, 97 + 26)) 
-    print "stress testing: word size %d samples %s" % (words_size, iterations)
-    failed = 0
-    for i in xrange(iterations):
-        #key = "".join([chr(97 + random.randint(0, 25)) for i in xrange(words_size)])
-        key = "".join([random.choice(alphabet) for i in xrange(words_size)])
-        if bloom_filter.contains(key):
-            failed += 1
+    if verbose:
+        print "stress testing: word size %d samples %s" % (words_size, iterations)
+    #key = "".join([chr(97 + random.randint(0, 25)) for i in xrange(words_size)])
+    keys = ["".join([rng.choice(alphabet) for i in xrange(words_size)]) for i in xrange(iterations)]
+    failed = bloom_filter.contains_many(keys).sum()
     return float(failed)/iterations
 
+def fp_report(bloom_filter, words_size, iterations, target_fp_rate=None):
+    """
+    False positive statistics of the filter - measured by stress test and estimated from its fill
+    """
+    return {
+            "size": bloom_filter.size,
+            "samples": iterations,
+            "measured_fp_rate": stress_test(words_size, iterations, bloom_filter),
+            "estimated_fp_rate": bloom_filter.estimated_fp_rate(),
+            "target_fp_rate": target_fp_rate,
+           }
+
+def print_fp_report(report):
+    for key in sorted(report.keys()):
+        print "%s: %s" % (key, report[key])
+
+def benchmark(words, hashes_num, strategies=None):
+    """
+    Builds the filter with every hash strategy and runs the stress test on it
+    """
+    results = {}
+    for name in strategies or sorted(HASH_STRATEGIES.keys()):
+        t = time.time()
+        bf = BloomFilter(FILTER_SIZE, HASH_STRATEGIES[name](hashes_num, FILTER_SIZE))
+        bf.from_key_gen(words)
+        build_time = time.time() - t
+        t = time.time()
+        failure_rate = stress_test(10, 50000, bf)
+        stress_time = time.time() - t
+        print "%s: build %s stress test %s failure rate %s" % (name, build_time, stress_time, failure_rate)
+        results[name] = (build_time, stress_time, failure_rate)
+    return results
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(open(WORDS_FN, "r").readlines(), BENCH_HASH_FUNCS_NUM)
+        sys.exit(0)
+    strategy = len(sys.argv) > 1 and sys.argv[1] or DoubleHashGenerator.name
+    filter_fn = FILTER_FN % strategy
     t = time.time()
-    bf = BloomFilter(FILTER_SIZE, HashGenerator(HASH_FUNCS_NUM, FILTER_SIZE))
-    bf.from_key_gen(open("/usr/share/dict/cracklib-small", "r"))
-    print "created filter in %s" % (time.time() - t)
+    if os.path.exists(filter_fn):
+        bf = BloomFilter.open(filter_fn)
+        print "opened filter in %s" % (time.time() - t)
+    else:
+        words = open(WORDS_FN, "r").readlines()
+        bf = BloomFilter.for_capacity(len(words), FP_RATE, HASH_STRATEGIES[strategy])
+        bf.from_key_gen(words)
+        bf.save(filter_fn)
+        print "created filter in %s" % (time.time() - t)
     t = time.time()
-    failure_rate = stress_test(10, 50000, bf)
-    print "failure rate:", failure_rate
+    print_fp_report(fp_report(bf, 10, 50000, FP_RATE))
     print "performed stress test in %s" % (time.time() - t)
     #resp = raw_input("type word:")
     #print bf.contains(resp)
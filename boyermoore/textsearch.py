@@ -0,0 +1,303 @@
+"""
+Text search with compile once / search many interface of ITextSearchAlgorithm
+from boyermoore.d, in python.
+
+    * BoyerMoore - bad character and good suffix tables, same as the D toy
+    * AhoCorasick - many patterns (e.g. whole word list) in one pass
+    * FindSearch - naive str.find loop, baseline for benchmarks
+
+Every algorithm yields match offsets lazily (finditer) and can scan big files
+mmap'd in chunks (search_file), matches crossing chunk boundaries are found once.
+"""
+
+import mmap
+import os
+import sys
+import time
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+class TextSearchAlgorithm(object):
+
+    def compile(self, pattern, alphabet=None):
+        """
+        Sets pattern and creates the cached data structures
+        """
+        raise NotImplementedError
+
+    def finditer(self, text):
+        """
+        Generator of indices where pattern starts
+        """
+        raise NotImplementedError
+
+    def search(self, text):
+        """
+        Returns list of indices where pattern starts
+        """
+        return list(self.finditer(text))
+
+    def overlap(self):
+        """
+        How many bytes of the previous chunk have to be searched again with the next one
+        """
+        return len(self.pattern) - 1
+
+    def search_chunks(self, data, chunk_size=CHUNK_SIZE):
+        """
+        Searches data (str or mmap) by chunks of chunk_size, only one chunk (plus overlap)
+        is in memory at once. Match is reported by the chunk it starts in.
+        """
+        overlap = self.overlap()
+        for start in xrange(0, len(data), chunk_size):
+            chunk = data[start: start + chunk_size + overlap]
+            for match in self.finditer(chunk):
+                if match < chunk_size:
+                    yield start + match
+
+    def search_file(self, fn, chunk_size=CHUNK_SIZE):
+        f = open(fn, "rb")
+        try:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for match in self.search_chunks(data, chunk_size):
+                    yield match
+            finally:
+                data.close()
+        finally:
+            f.close()
+
+class FindSearch(TextSearchAlgorithm):
+    """
+    str.find in a loop
+    """
+    def compile(self, pattern, alphabet=None):
+        self.pattern = pattern
+
+    def finditer(self, text):
+        if not self.pattern:
+            return
+        index = text.find(self.pattern)
+        while index >= 0:
+            yield index
+            index = text.find(self.pattern, index + 1)
+
+class BoyerMoore(TextSearchAlgorithm):
+
+    def compile(self, pattern, alphabet=None):
+        """
+        alphabet is optional - characters not in pattern shift by whole pattern anyway
+        """
+        self.pattern = pattern
+        if not pattern:
+            return
+        self.good_suffix = self._good_suffix_table(pattern)
+        self.bad_char = self._bad_char_table(pattern, alphabet or "")
+        self.match_shift = len(pattern) - self._longest_border(pattern)
+
+    @staticmethod
+    def _good_suffix_table(pattern):
+        """
+        table[i] is the shift if there is inequality between pattern and text on pos i
+        """
+        pat_len = len(pattern)
+        table = [pat_len] * pat_len
+        table[-1] = 1
+        for i in xrange(pat_len - 2, -1, -1):
+            not_match = pattern[i]
+            suffix = pattern[i + 1:]
+            #find the good suffix inside pattern
+            for j in xrange(pat_len - 1, len(suffix), -1):
+                if pattern[j - len(suffix): j] == suffix and pattern[j - len(suffix) - 1] != not_match:
+                    table[i] = pat_len - j
+                    break
+            else:
+                #no offset found yet - any suffix matching the beginning
+                for j in xrange(len(suffix), 0, -1):
+                    if suffix[-j:] == pattern[:j]:
+                        table[i] = pat_len - j
+                        break
+        return table
+
+    @staticmethod
+    def _bad_char_table(pattern, alphabet):
+        pat_len = len(pattern)
+        table = dict((c, pat_len) for c in alphabet)
+        for i in xrange(pat_len - 1):
+            table[pattern[i]] = pat_len - 1 - i
+        return table
+
+    @staticmethod
+    def _longest_border(pattern):
+        """
+        Length of the longest proper prefix which is also suffix (KMP failure function)
+        """
+        border = [0] * len(pattern)
+        k = 0
+        for i in xrange(1, len(pattern)):
+            while k and pattern[i] != pattern[k]:
+                k = border[k - 1]
+            if pattern[i] == pattern[k]:
+                k += 1
+            border[i] = k
+        return border[-1]
+
+    def finditer(self, text):
+        pattern = self.pattern
+        pat_len = len(pattern)
+        if not pat_len:
+            return
+        last = pat_len - 1
+        last_char = pattern[last]
+        good_suffix, bad_char = self.good_suffix, self.bad_char
+        text_len = len(text)
+        #end of the window we see from the text
+        index = pat_len
+        while index <= text_len:
+            c = text[index - 1]
+            if c != last_char:
+                index += bad_char.get(c, pat_len)
+                continue
+            base = index - pat_len
+            i = last - 1
+            while i >= 0 and text[base + i] == pattern[i]:
+                i -= 1
+            if i < 0:
+                yield base
+                index += self.match_shift
+            else:
+                index += max(good_suffix[i], bad_char.get(text[base + i], pat_len) - (last - i), 1)
+
+class AhoCorasick(TextSearchAlgorithm):
+    """
+    Matches all the patterns at once. Matches are (index, pattern) pairs, repeated
+    patterns are matched once.
+    """
+    def compile(self, patterns, alphabet=None):
+        self.patterns = _unique([pattern for pattern in patterns if pattern])
+        goto = [{}]
+        out = [()]
+        for pattern in self.patterns:
+            state = 0
+            for c in pattern:
+                if c not in goto[state]:
+                    goto[state][c] = len(goto)
+                    goto.append({})
+                    out.append(())
+                state = goto[state][c]
+            out[state] += (pattern,)
+        #failure links in breadth first order, outputs are merged along them
+        fail = [0] * len(goto)
+        queue = goto[0].values()
+        for state in queue:
+            for c, next_state in goto[state].iteritems():
+                queue.append(next_state)
+                f = fail[state]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[next_state] = goto[f].get(c, 0)
+                out[next_state] += out[fail[next_state]]
+        self.goto, self.fail, self.out = goto, fail, out
+
+    def overlap(self):
+        return max(len(pattern) for pattern in self.patterns) - 1 if self.patterns else 0
+
+    def _scan(self, text, base, state):
+        """
+        Generator of matches in text starting in automaton state, text starts at offset base.
+        Final state is stored to state[0].
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        current = state[0]
+        for pos, c in enumerate(text):
+            while current and c not in goto[current]:
+                current = fail[current]
+            current = goto[current].get(c, 0)
+            if out[current]:
+                for pattern in out[current]:
+                    yield base + pos - len(pattern) + 1, pattern
+        state[0] = current
+
+    def finditer(self, text):
+        return self._scan(text, 0, [0])
+
+    def search_chunks(self, data, chunk_size=CHUNK_SIZE):
+        """
+        Automaton state is carried from chunk to chunk, so chunks don't overlap
+        """
+        state = [0]
+        for start in xrange(0, len(data), chunk_size):
+            for match in self._scan(data[start: start + chunk_size], start, state):
+                yield match
+
+def _unique(items):
+    """
+    Items without repeats, in the order of first occurrence
+    """
+    seen = set()
+    unique = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            unique.append(item)
+    return unique
+
+def _timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+def benchmark(text, patterns):
+    """
+    Compares algorithms with naive str.find loops - single longest pattern and all the patterns
+    """
+    patterns = _unique(patterns)
+    pattern = max(patterns, key=len)
+    print "text: %d bytes, patterns: %d" % (len(text), len(patterns))
+    for algorithm in [FindSearch(), BoyerMoore()]:
+        algorithm.compile(pattern)
+        matches, seconds = _timed(lambda: algorithm.search(text))
+        print "%s %r: %d matches in %.3fs" % (algorithm.__class__.__name__, pattern, len(matches), seconds)
+
+    def find_all():
+        matches = []
+        searcher = FindSearch()
+        for pattern in patterns:
+            searcher.compile(pattern)
+            matches.extend((index, pattern) for index in searcher.finditer(text))
+        return matches
+    matches, seconds = _timed(find_all)
+    print "FindSearch all patterns: %d matches in %.3fs" % (len(matches), seconds)
+    aho_corasick = AhoCorasick()
+    aho_corasick.compile(patterns)
+    matches, seconds = _timed(lambda: aho_corasick.search(text))
+    print "AhoCorasick all patterns: %d matches in %.3fs" % (len(matches), seconds)
+
+def _read_words(fn):
+    f = open(fn, "r")
+    try:
+        return [line.strip() for line in f if line.strip()]
+    finally:
+        f.close()
+
+if __name__ == "__main__":
+    # textsearch.py pattern file
+    # textsearch.py -w words_file file
+    # textsearch.py bench file words_file
+    if sys.argv[1] == "bench":
+        f = open(sys.argv[2], "rb")
+        text = f.read()
+        f.close()
+        benchmark(text, _read_words(sys.argv[3]))
+    elif sys.argv[1] == "-w":
+        algorithm = AhoCorasick()
+        algorithm.compile(_read_words(sys.argv[2]))
+        for index, word in algorithm.search_file(sys.argv[3]):
+            print index, word
+    else:
+        algorithm = BoyerMoore()
+        algorithm.compile(sys.argv[1])
+        for index in algorithm.search_file(sys.argv[2]):
+            print index
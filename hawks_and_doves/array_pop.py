@@ -0,0 +1,300 @@
+"""
+Array backed population for the "hawks and doves" simulation.
+
+Same model as had.Pop, but individuals are rows of numpy arrays (species code, payoff,
+fights, birth round) instead of Indi objects:
+    * age is derived from the birth round, no per-round update of all individuals
+    * weakest individual is found in a heap of fitness entries with lazy invalidation
+      (every individual has a version, entries with old version are skipped), the top
+      individuals in the same way in a max heap
+    * whole state including random generators can be checkpointed and resumed
+
+Besides the exact sequential mode (one fight per round, same as had.run) there is a batched
+mode resolving many disjoint fights per step - strategies are integer codes, payoffs are
+looked up in a numpy array and all the randomness is drawn in bulk.
+"""
+
+import cPickle
+import heapq
+import os
+import random
+import numpy
+
+import had
+
+#strategy codes - index into payoff array
+AGGRESIVE, PEACEFUL = 0, 1
+
+def payoff_array(payoff_matrix):
+    """
+    PAYOFF_MATRIX as 2x2 array indexed by strategy codes
+    """
+    strategies = [had.ST_AGGRESIVE, had.ST_PEACEFUL]
+    return numpy.array([[payoff_matrix[s1][s2] for s2 in strategies] for s1 in strategies])
+
+def aggression_table(species):
+    """
+    Probability of aggresive strategy of species[i] against species[j]
+    """
+    return numpy.array([[s1.get_aggression_prob(s2) for s2 in species] for s1 in species])
+
+class ArrayPop(object):
+    """
+    Population - stores indis as arrays, performs fights, updates and evolutionary replace
+    """
+    #heap is rebuilt once stale entries outnumber live ones this many times
+    HEAP_SLACK = 4
+    #arrays stored in checkpoints
+    STATE_ARRAYS = ["codes", "payoff", "fights", "birth", "versions", "counts"]
+
+    def __init__(self, species, pop_size, seed=None, config=None):
+        self.config = config or had.Config()
+        #species classes indexed by their code
+        self.species = sorted(species.keys(), key=lambda s: s.get_name())
+        codes = []
+        for code, s in enumerate(self.species):
+            codes.extend([code] * int(species[s] * pop_size))
+        size = len(codes)
+        self.codes = numpy.array(codes, dtype=numpy.int8)
+        self.payoff = numpy.zeros(size, dtype=numpy.float64)
+        self.fights = numpy.zeros(size, dtype=numpy.int64)
+        self.birth = numpy.zeros(size, dtype=numpy.int64)
+        self.versions = numpy.zeros(size, dtype=numpy.int64)
+        self.counts = numpy.bincount(self.codes, minlength=len(self.species)).astype(numpy.int64)
+        self.round = 0
+        self._rebuild_heap()
+        #batched mode
+        self.rng = numpy.random.RandomState(seed)
+        self.payoffs = payoff_array(self.config.payoff_matrix)
+        self.aggression = aggression_table(self.species)
+
+    @property
+    def representants(self):
+        return dict(zip(self.species, self.counts.tolist()))
+
+    @property
+    def ages(self):
+        return self.round - self.birth
+
+    def fitness(self, index):
+        """
+        Fitness is average payoff per fight. Younglings are protected a "free win"
+        """
+        fights = self.fights[index]
+        if fights == 0:
+            return self.config.young_fitness
+        return self.payoff[index] / fights
+
+    def fitnesses(self, indices=slice(None)):
+        """
+        Fitnesses of individuals at indices (all by default)
+        """
+        fights = self.fights[indices]
+        return numpy.where(fights == 0, self.config.young_fitness, self.payoff[indices] / numpy.maximum(fights, 1))
+
+    def _rebuild_heap(self):
+        fitnesses = self.fitnesses().tolist()
+        indices = xrange(len(self.codes))
+        versions = self.versions.tolist()
+        self.heap = zip(fitnesses, indices, versions)
+        heapq.heapify(self.heap)
+        #max heap of the top individuals
+        self.top_heap = zip([-fitness for fitness in fitnesses], indices, versions)
+        heapq.heapify(self.top_heap)
+
+    def _touch(self, index):
+        """
+        Individual changed - invalidates its heap entries and pushes the current one
+        """
+        self.versions[index] += 1
+        fitness, version = self.fitness(index), self.versions[index]
+        heapq.heappush(self.heap, (fitness, index, version))
+        heapq.heappush(self.top_heap, (-fitness, index, version))
+        if max(len(self.heap), len(self.top_heap)) > self.HEAP_SLACK * len(self.codes):
+            self._rebuild_heap()
+
+    def _touch_many(self, indices):
+        self.versions[indices] += 1
+        if max(len(self.heap), len(self.top_heap)) + len(indices) > self.HEAP_SLACK * len(self.codes):
+            self._rebuild_heap()
+            return
+        fitnesses = self.fitnesses(indices)
+        for fitness, index, version in zip(fitnesses.tolist(), indices.tolist(), self.versions[indices].tolist()):
+            heapq.heappush(self.heap, (fitness, index, version))
+            heapq.heappush(self.top_heap, (-fitness, index, version))
+
+    def update_ages(self):
+        self.round += 1
+
+    def perform_fight(self):
+        indi1, indi2 = random.sample(xrange(len(self.codes)), 2)
+        species1, species2 = self.species[self.codes[indi1]], self.species[self.codes[indi2]]
+        strategy1 = species1.get_strategy(species2)
+        strategy2 = species2.get_strategy(species1)
+        payoff_matrix = self.config.payoff_matrix
+        for indi, payoff in [(indi1, payoff_matrix[strategy1][strategy2]),
+                             (indi2, payoff_matrix[strategy2][strategy1])]:
+            self.fights[indi] += 1
+            self.payoff[indi] += payoff
+            self._touch(indi)
+
+    def _sample(self, num):
+        """
+        num distinct random individuals in random order. Small samples are drawn with
+        repeats and deduplicated (keeping first occurrences) instead of permuting everyone.
+        """
+        size = len(self.codes)
+        if 4 * num > size:
+            return self.rng.permutation(size)[:num]
+        sample = numpy.empty(0, dtype=numpy.int64)
+        while len(sample) < num:
+            draws = numpy.append(sample, self.rng.randint(size, size=2 * num))
+            sample = draws[numpy.sort(numpy.unique(draws, return_index=True)[1])]
+        return sample[:num]
+
+    def perform_fights(self, fights_num):
+        """
+        Resolves fights_num fights between disjoint pairs at once, each of them counts as a round.
+        Evolutionary replaces that would happen in those rounds are performed afterwards.
+        """
+        size = len(self.codes)
+        if size < 2:
+            raise ValueError("population of %d individuals can't fight" % size)
+        fights_num = min(fights_num, size / 2)
+        fighters = self._sample(2 * fights_num)
+        indi1, indi2 = fighters[:fights_num], fighters[fights_num:]
+        species1, species2 = self.codes[indi1], self.codes[indi2]
+        random_draws = self.rng.random_sample((2, fights_num))
+        strategy1 = numpy.where(random_draws[0] < self.aggression[species1, species2], AGGRESIVE, PEACEFUL)
+        strategy2 = numpy.where(random_draws[1] < self.aggression[species2, species1], AGGRESIVE, PEACEFUL)
+        #pairs are disjoint, so fancy indexed updates don't collide
+        self.fights[fighters] += 1
+        self.payoff[indi1] += self.payoffs[strategy1, strategy2]
+        self.payoff[indi2] += self.payoffs[strategy2, strategy1]
+        self._touch_many(fighters)
+        self.round += fights_num
+        if self.config.evo_replace_prob:
+            for _ in xrange(self.rng.binomial(fights_num, self.config.evo_replace_prob)):
+                self._replace_indi_by_index(self.weakest(), self.rng.randint(len(self.species)))
+
+    def weakest(self):
+        heap = self.heap
+        while heap[0][2] != self.versions[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    def top(self, k):
+        """
+        k fittest individuals as list of (fitness, index) - pops k live entries (dropping
+        stale ones on the way) and pushes the live ones back
+        """
+        heap = self.top_heap
+        found = []
+        while heap and len(found) < k:
+            entry = heapq.heappop(heap)
+            if entry[2] == self.versions[entry[1]]:
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(heap, entry)
+        return [(-fitness, index) for fitness, index, version in found]
+
+    def perform_evo_replace(self):
+        """
+        Selects weakest indi and replaces it with random indi.
+        """
+        self._replace_indi_by_index(self.weakest())
+
+    def _replace_indi_by_index(self, index, code=None):
+        if code is None:
+            code = random.randrange(len(self.species))
+        self.counts[self.codes[index]] -= 1
+        self.counts[code] += 1
+        self.codes[index] = code
+        self.payoff[index] = 0
+        self.fights[index] = 0
+        self.birth[index] = self.round
+        self._touch(index)
+
+    def print_stats(self, round):
+        print "Population statistics in round %d:" % round
+        for code, s in enumerate(self.species):
+            print "%s: %d" % (s.get_name(), self.counts[code])
+        #print top ten fitness
+        print "Top10: "
+        for fitness, index in self.top(10):
+            print "%s: %s" % (self.species[self.codes[index]].get_name(), fitness)
+
+    def checkpoint(self, path):
+        """
+        Stores the population, round and state of both random generators. File is
+        replaced atomically, so an interrupted checkpoint keeps the previous one.
+        """
+        state = {
+                 "config": self.config,
+                 "species": self.species,
+                 "arrays": dict((name, getattr(self, name)) for name in self.STATE_ARRAYS),
+                 "round": self.round,
+                 "rng": self.rng.get_state(),
+                 "random": random.getstate(),
+                }
+        tmp_path = path + ".tmp"
+        f = open(tmp_path, "wb")
+        try:
+            cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def from_checkpoint(cls, path):
+        f = open(path, "rb")
+        try:
+            state = cPickle.load(f)
+        finally:
+            f.close()
+        pop = cls.__new__(cls)
+        pop.config = state["config"]
+        pop.species = state["species"]
+        for name, value in state["arrays"].items():
+            setattr(pop, name, value)
+        pop.round = state["round"]
+        pop._rebuild_heap()
+        pop.rng = numpy.random.RandomState()
+        pop.rng.set_state(state["rng"])
+        random.setstate(state["random"])
+        pop.payoffs = payoff_array(pop.config.payoff_matrix)
+        pop.aggression = aggression_table(pop.species)
+        return pop
+
+def run(config=None, batch_size=None, seed=None):
+    """
+    Exact sequential simulation (one fight per round as in had.run, reproducible given seed) or batched one
+    with batch_size fights per step
+    """
+    config = config or had.Config()
+    if batch_size:
+        pop = ArrayPop(config.species, config.pop_size, seed, config)
+        next_stats = 0
+        while pop.round < config.rounds:
+            if pop.round >= next_stats:
+                pop.print_stats(pop.round)
+                next_stats += config.stats_freq
+            pop.perform_fights(min(batch_size, config.rounds - pop.round))
+        return pop
+
+    if seed is not None:
+        random.seed(seed)
+    pop = ArrayPop(config.species, config.pop_size, config=config)
+    for round in xrange(config.rounds):
+        pop.perform_fight()
+        pop.update_ages()
+        if config.evo_replace_prob and config.evo_replace_prob > random.random():
+            pop.perform_evo_replace()
+
+        if round % config.stats_freq == 0:
+            pop.print_stats(round)
+    return pop
+
+if __name__ == "__main__":
+    import sys
+    run(batch_size=len(sys.argv) > 1 and int(sys.argv[1]) or None)
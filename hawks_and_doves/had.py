@@ -26,6 +26,7 @@ PROGRAMMING STUFF:
     * carefully with [mutable_object] * n - list of references to the same object is created
 """
 
+import heapq
 import random
 
 POP_SIZE = 1000
@@ -42,16 +43,19 @@ ST_AGGRESIVE = "aggresive"
 ST_PEACEFUL = "peaceful"
 RES_UNKNOWN = "unknown" 
 
-PAYOFF_MATRIX = {
-    ST_AGGRESIVE: {
-                ST_AGGRESIVE: POF_WIN/2.0 + POF_FIGHT_COST,
-                ST_PEACEFUL: POF_WIN,
-                },
-    ST_PEACEFUL: {
-                ST_AGGRESIVE: 0,
-                ST_PEACEFUL: POF_WIN/2.0 + POF_LOST_TIME,
-              }
-}
+def make_payoff_matrix(win=POF_WIN, fight_cost=POF_FIGHT_COST, lost_time=POF_LOST_TIME):
+    return {
+        ST_AGGRESIVE: {
+                    ST_AGGRESIVE: win/2.0 + fight_cost,
+                    ST_PEACEFUL: win,
+                    },
+        ST_PEACEFUL: {
+                    ST_AGGRESIVE: 0,
+                    ST_PEACEFUL: win/2.0 + lost_time,
+                  }
+    }
+
+PAYOFF_MATRIX = make_payoff_matrix()
 
 class Indi(object):
     """
@@ -66,13 +70,23 @@ class Indi(object):
     def get_strategy(cls, opponent_species=None):
         return cls.IMPLICIT_STRATEGY
 
+    @classmethod
+    def get_aggression_prob(cls, opponent_species=None):
+        """
+        Probability of aggresive strategy against opponent_species
+        """
+        return cls.get_strategy(opponent_species) == ST_AGGRESIVE and 1.0 or 0.0
+
     @property
     def fitness(self):
+        return self.get_fitness()
+
+    def get_fitness(self, young_fitness=POF_WIN):
         """
         Fitness is average payoff per fight. Younglings are protected a "free win"
         """
         if self.fights == 0:
-            return POF_WIN
+            return young_fitness
         else:
             return float(self.payoff) / self.fights
 
@@ -99,14 +113,19 @@ class Mutant(Indi):
     """
     Ratio of aggresiveness x peacefulness is taken from results 1 on 1 hawks x doves.
     """
+    AGGRESION_PROB = 0.3
 
     @classmethod
     def get_strategy(cls, opponent_species=None):
-        if random.random() <= 0.3:
+        if random.random() <= cls.AGGRESION_PROB:
             return ST_AGGRESIVE
         else:
             return ST_PEACEFUL
 
+    @classmethod
+    def get_aggression_prob(cls, opponent_species=None):
+        return cls.AGGRESION_PROB
+
 class Adaptable(Indi):
     """
     Peaceful against Adaptables otherwise aggresive
@@ -127,11 +146,34 @@ SPECIES = {
              Mutant: 0
              }
 
+class Config(object):
+    """
+    Parameters of one simulation run, so that runs don't share module globals.
+    Defaults are the module constants.
+    """
+    def __init__(self, **params):
+        self.pop_size = POP_SIZE
+        self.rounds = ROUNDS
+        self.stats_freq = STATS_FREQ
+        self.evo_replace_prob = EVO_REPLACE_PROB
+        #copies, changes of one config don't leak to the module defaults
+        self.payoff_matrix = dict((strategy, dict(row)) for strategy, row in PAYOFF_MATRIX.items())
+        #species classes with their initial percentage in the population
+        self.species = dict(SPECIES)
+        #fitness of individuals that haven't fought yet
+        self.young_fitness = POF_WIN
+        for name, value in params.items():
+            if not hasattr(self, name):
+                raise TypeError("unknown config parameter %s" % name)
+            setattr(self, name, value)
+
 class Pop(object):
     """
     Population - stores indis, performs fights, updates and evolutionary replace
     """
-    def __init__(self, species, pop_size):
+    def __init__(self, species, pop_size, config=None):
+        self.config = config or Config()
+        self.species = species.keys()
         self.indis = []
         self.representants = dict(zip(species.keys(), [0] * len(species)))
 
@@ -158,7 +200,8 @@ class Pop(object):
         """
         Selects weakest indi and replaces it with random indi.
         """
-        weakest = min(self.indis, key=lambda indi: indi.fitness)
+        young_fitness = self.config.young_fitness
+        weakest = min(self.indis, key=lambda indi: indi.get_fitness(young_fitness))
         index = self.indis.index(weakest)
         self._replace_indi_by_index(index)
 
@@ -168,35 +211,37 @@ class Pop(object):
             print "%s: %d" % (r.get_name(), count) 
         #print top ten fitness
         print "Top10: "
-        for indi in sorted(self.indis, key=lambda indi: indi.fitness, reverse=True)[:10]:
-            print "%s: %s" % (indi, indi.fitness)
+        young_fitness = self.config.young_fitness
+        for indi in heapq.nlargest(10, self.indis, key=lambda indi: indi.get_fitness(young_fitness)):
+            print "%s: %s" % (indi, indi.get_fitness(young_fitness))
 
-    @staticmethod
-    def _calc_payoffs(indi1, indi2):
+    def _calc_payoffs(self, indi1, indi2):
+        payoff_matrix = self.config.payoff_matrix
         strategy1 = indi1.get_strategy(indi2.get_species())
         strategy2 = indi2.get_strategy(indi1.get_species())
-        return (PAYOFF_MATRIX[strategy1][strategy2], 
-                PAYOFF_MATRIX[strategy2][strategy1])
+        return (payoff_matrix[strategy1][strategy2], 
+                payoff_matrix[strategy2][strategy1])
 
     def _replace_indi_by_index(self, index, new_indi=None):
         if not new_indi:
-            new_indi = random.choice(SPECIES.keys())()
+            new_indi = random.choice(self.species)()
         old_indi = self.indis[index]
         self.indis[index] = new_indi
         self.representants[old_indi.get_species()] -= 1
         self.representants[new_indi.get_species()] += 1
         #print "Replacing dead %s with %s" % (indi, new_indi)
 
-def run():
-    pop = Pop(SPECIES, POP_SIZE) 
+def run(config=None):
+    config = config or Config()
+    pop = Pop(config.species, config.pop_size, config) 
 
-    for round in xrange(ROUNDS):
+    for round in xrange(config.rounds):
         pop.perform_fight()
         pop.update_ages()
-        if EVO_REPLACE_PROB and EVO_REPLACE_PROB > random.random():
+        if config.evo_replace_prob and config.evo_replace_prob > random.random():
             pop.perform_evo_replace()
 
-        if round % STATS_FREQ == 0:
+        if round % config.stats_freq == 0:
             pop.print_stats(round)
 
 if __name__ == "__main__":
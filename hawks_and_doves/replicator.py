@@ -0,0 +1,178 @@
+"""
+Mean-field model of the "hawks and doves" simulation - replicator dynamics.
+
+Expected payoff of species i against species j is derived from the payoff matrix and
+aggression probabilities of both species (Mutant's mixed strategy, Adaptable's conditional one).
+Species fractions x then follow
+
+    dx_i/dt = x_i * (f_i - f) + mutation * (1/n - x_i),    f_i = (A x)_i,  f = x.A.x
+
+The mutation term stands for the evolutionary replace by random species - without it
+species missing at the start never appear.
+
+    * integrate - adaptive step Runge-Kutta (Bogacki-Shampine 3(2)) until the flow almost stops,
+      polish - Newton iterations for the exact rest point
+    * fixed_points - all rest points of the pure replicator equation (mutation 0) by support
+      enumeration, with their stability on the simplex
+    * cross_check - equilibrium against the batched agent simulation at the same parameters
+"""
+
+import itertools
+import numpy
+
+import had
+from array_pop import ArrayPop, payoff_array, aggression_table
+
+MUTATION = 0.001
+
+def expected_payoffs(species, payoff_matrix=had.PAYOFF_MATRIX):
+    """
+    A[i, j] - expected payoff of species[i] in a fight against species[j]
+    """
+    payoffs = payoff_array(payoff_matrix)
+    aggression = aggression_table(species)
+    p, q = aggression, aggression.T
+    return (p * q * payoffs[0, 0] + p * (1 - q) * payoffs[0, 1]
+            + (1 - p) * q * payoffs[1, 0] + (1 - p) * (1 - q) * payoffs[1, 1])
+
+def replicator(x, payoffs, mutation=0.0):
+    fitness = payoffs.dot(x)
+    return x * (fitness - x.dot(fitness)) + mutation * (1.0 / len(x) - x)
+
+def integrate(payoffs, x0, mutation=0.0, t_max=1e4, tol=1e-8, eq_tol=1e-6, h=0.01):
+    """
+    Integrates dynamics from fractions x0 until the flow is slower than eq_tol or t_max.
+    Returns (x, t, steps).
+    """
+    x = numpy.asarray(x0, dtype=numpy.float64)
+    x = x / x.sum()
+    t = 0.0
+    steps = 0
+    k1 = replicator(x, payoffs, mutation)
+    while t < t_max and numpy.abs(k1).max() > eq_tol:
+        h = min(h, t_max - t)
+        k2 = replicator(x + 0.5 * h * k1, payoffs, mutation)
+        k3 = replicator(x + 0.75 * h * k2, payoffs, mutation)
+        new_x = x + h * (2 * k1 + 3 * k2 + 4 * k3) / 9.0
+        k4 = replicator(new_x, payoffs, mutation)
+        #difference of the 3rd and embedded 2nd order solutions
+        error = numpy.abs(h * (-5 * k1 / 72.0 + k2 / 12.0 + k3 / 9.0 - k4 / 8.0)).max()
+        if error <= tol:
+            t += h
+            steps += 1
+            x = numpy.maximum(new_x, 0)
+            x /= x.sum()
+            k1 = replicator(x, payoffs, mutation)
+        h *= min(5.0, max(0.2, 0.9 * (tol / max(error, 1e-300)) ** (1 / 3.0)))
+    return x, t, steps
+
+def jacobian(x, payoffs):
+    fitness = payoffs.dot(x)
+    mean = x.dot(fitness)
+    grad_mean = fitness + payoffs.T.dot(x)
+    return numpy.diag(fitness - mean) + x[:, None] * (payoffs - grad_mean[None, :])
+
+def polish(x, payoffs, mutation=0.0, iters=20, tol=1e-13):
+    """
+    Newton iterations for the rest point near x (keeping sum(x) == 1)
+    """
+    n = len(x)
+    for _ in xrange(iters):
+        rhs = replicator(x, payoffs, mutation)
+        if numpy.abs(rhs).max() < tol:
+            break
+        system = numpy.vstack([jacobian(x, payoffs) - mutation * numpy.eye(n), numpy.ones(n)])
+        step = numpy.linalg.lstsq(system, numpy.append(-rhs, 0), rcond=None)[0]
+        x = numpy.maximum(x + step, 0)
+        x /= x.sum()
+    return x
+
+def is_stable(x, payoffs):
+    """
+    All eigenvalues of the jacobian restricted to the simplex have negative real part
+    """
+    n = len(x)
+    if n == 1:
+        return True
+    #orthonormal basis of the plane sum(x) == 0
+    basis = numpy.linalg.qr(numpy.eye(n)[:, :n - 1] - 1.0 / n)[0]
+    restricted = basis.T.dot(jacobian(x, payoffs)).dot(basis)
+    return bool((numpy.linalg.eigvals(restricted).real < -1e-12).all())
+
+def fixed_points(payoffs):
+    """
+    Rest points of the replicator equation - for every support the species in it
+    have equal fitness. Returns list of (x, stable).
+    """
+    n = len(payoffs)
+    points = []
+    for size in xrange(1, n + 1):
+        for support in itertools.combinations(xrange(n), size):
+            support = list(support)
+            #A_SS x_S - f = 0, sum x_S = 1
+            system = numpy.zeros((size + 1, size + 1))
+            system[:size, :size] = payoffs[numpy.ix_(support, support)]
+            system[:size, size] = -1
+            system[size, :size] = 1
+            rhs = numpy.zeros(size + 1)
+            rhs[size] = 1
+            try:
+                solution = numpy.linalg.solve(system, rhs)
+            except numpy.linalg.LinAlgError:
+                continue
+            if (solution[:size] <= 1e-12).any():
+                continue
+            x = numpy.zeros(n)
+            x[support] = solution[:size]
+            if not any(numpy.allclose(x, point) for point, stable in points):
+                points.append((x, is_stable(x, payoffs)))
+    return points
+
+def equilibrium(config=None, mutation=MUTATION):
+    """
+    Species fractions the dynamics settles in from config's initial mix. Returns
+    (species, fractions) - species sorted by name as in ArrayPop.
+    """
+    config = config or had.Config()
+    species = sorted(config.species.keys(), key=lambda s: s.get_name())
+    payoffs = expected_payoffs(species, config.payoff_matrix)
+    x0 = numpy.array([config.species[s] for s in species], dtype=numpy.float64)
+    if not x0.sum():
+        x0 = numpy.ones(len(species))
+    return species, polish(integrate(payoffs, x0, mutation)[0], payoffs, mutation)
+
+def cross_check(config=None, seeds=range(4), batch_size=100, mutation=MUTATION):
+    """
+    Mean-field equilibrium against average final fractions of the agent simulation.
+    Returns (species, mean field fractions, agent fractions).
+    """
+    config = config or had.Config()
+    species, mean_field = equilibrium(config, mutation)
+    agent = numpy.zeros(len(species))
+    for seed in seeds:
+        pop = ArrayPop(config.species, config.pop_size, seed, config)
+        while pop.round < config.rounds:
+            pop.perform_fights(min(batch_size, config.rounds - pop.round))
+        agent += pop.counts / float(pop.counts.sum())
+    return species, mean_field, agent / len(seeds)
+
+def print_fixed_points(species, payoffs):
+    names = [s.get_name() for s in species]
+    print "expected payoffs (%s):" % ", ".join(names)
+    print payoffs
+    for x, stable in fixed_points(payoffs):
+        print "%s %s" % (stable and "stable  " or "unstable", ", ".join("%s: %.4f" % item for item in zip(names, x)))
+
+if __name__ == "__main__":
+    import time
+    for species in [[had.Hawk, had.Dove], [had.Hawk, had.Dove, had.Mutant, had.Adaptable]]:
+        species = sorted(species, key=lambda s: s.get_name())
+        t = time.time()
+        print_fixed_points(species, expected_payoffs(species))
+        print "solved in %.4fs" % (time.time() - t)
+    config = had.Config(species={had.Hawk: 0.5, had.Dove: 0.5}, rounds=200000)
+    t = time.time()
+    species, mean_field, agent = cross_check(config)
+    print "cross check in %.1fs" % (time.time() - t)
+    for s, x, y in zip(species, mean_field, agent):
+        print "%s: mean field %.3f agents %.3f" % (s.get_name(), x, y)
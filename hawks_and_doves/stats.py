@@ -0,0 +1,143 @@
+"""
+Statistics and checkpoints of long "hawks and doves" runs.
+
+Snapshots (round, species counts, top k fitnesses and their species) are appended as
+fixed size records to a binary time series file, which is read back as numpy structured
+array - every field is a column. Counts are kept incrementally by the population and the
+top k comes from its max heap, so a snapshot doesn't touch the whole population.
+
+run() checkpoints the array population every checkpoint_freq rounds and resumes from
+the checkpoint when it exists - the snapshots file then continues where it ended.
+"""
+
+import os
+import struct
+import sys
+import numpy
+
+import had
+from array_pop import ArrayPop
+
+STATS_MAGIC = "HADS"
+STATS_VERSION = 1
+#magic, version, species num, top k
+_STATS_HEADER = struct.Struct("<4sHII")
+NAME_SIZE = 16
+TOP_K = 10
+
+def snapshot_dtype(species_num, top_k):
+    return numpy.dtype([
+                        ("round", "<i8"),
+                        ("counts", "<i8", (species_num,)),
+                        ("top_fitness", "<f8", (top_k,)),
+                        ("top_species", "<i1", (top_k,)),
+                       ])
+
+class StatsFile(object):
+    """
+    Appends snapshots of ArrayPop to file at path, existing file with the same species
+    is continued (records from from_round on are dropped, they are taken again).
+    """
+    def __init__(self, path, species_names, top_k=TOP_K, from_round=None):
+        self.path = path
+        self.species_names = species_names
+        self.top_k = top_k
+        self.dtype = snapshot_dtype(len(species_names), top_k)
+        header = self._header()
+        if os.path.exists(path) and from_round is not None:
+            names, dtype, records = read_snapshots(path)
+            if names != species_names or dtype != self.dtype:
+                raise ValueError("%s: stats of a different population" % path)
+            self.f = open(path, "r+b")
+            self.f.truncate(len(header) + records[records["round"] < from_round].nbytes)
+            self.f.seek(0, os.SEEK_END)
+        else:
+            self.f = open(path, "wb")
+            self.f.write(header)
+
+    def _header(self):
+        return (_STATS_HEADER.pack(STATS_MAGIC, STATS_VERSION, len(self.species_names), self.top_k)
+                + "".join(name[:NAME_SIZE].ljust(NAME_SIZE, "\0") for name in self.species_names))
+
+    def append(self, pop):
+        record = numpy.zeros(1, dtype=self.dtype)
+        record["round"] = pop.round
+        record["counts"] = pop.counts
+        record["top_fitness"] = numpy.nan
+        record["top_species"] = -1
+        top = pop.top(self.top_k)
+        for i, (fitness, index) in enumerate(top):
+            record["top_fitness"][0, i] = fitness
+            record["top_species"][0, i] = pop.codes[index]
+        record.tofile(self.f)
+
+    def flush(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+def read_snapshots(path):
+    """
+    Returns (species names, record dtype, records array)
+    """
+    f = open(path, "rb")
+    try:
+        magic, version, species_num, top_k = _STATS_HEADER.unpack(f.read(_STATS_HEADER.size))
+        if magic != STATS_MAGIC:
+            raise ValueError("%s: not a stats file" % path)
+        if version != STATS_VERSION:
+            raise ValueError("%s: unsupported stats file version %d" % (path, version))
+        names = [f.read(NAME_SIZE).rstrip("\0") for _ in xrange(species_num)]
+        dtype = snapshot_dtype(species_num, top_k)
+        return names, dtype, numpy.fromfile(f, dtype=dtype)
+    finally:
+        f.close()
+
+def run(config=None, batch_size=100, seed=None, stats_path="stats.bin", checkpoint_path=None,
+        checkpoint_freq=None, top_k=TOP_K):
+    """
+    Batched simulation with snapshots every config.stats_freq rounds. Resumes from
+    checkpoint_path if it exists.
+    """
+    config = config or had.Config()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        pop = ArrayPop.from_checkpoint(checkpoint_path)
+        config = pop.config
+        print "resuming from round %d" % pop.round
+        stats = StatsFile(stats_path, [s.get_name() for s in pop.species], top_k, pop.round)
+    else:
+        pop = ArrayPop(config.species, config.pop_size, seed, config)
+        stats = StatsFile(stats_path, [s.get_name() for s in pop.species], top_k)
+    checkpoint_freq = checkpoint_freq or config.rounds
+    next_stats = -(-pop.round / config.stats_freq) * config.stats_freq
+    next_checkpoint = pop.round + checkpoint_freq
+    try:
+        while pop.round < config.rounds:
+            if pop.round >= next_stats:
+                stats.append(pop)
+                next_stats += config.stats_freq
+            pop.perform_fights(min(batch_size, config.rounds - pop.round, next_stats - pop.round,
+                                   next_checkpoint - pop.round))
+            if checkpoint_path and pop.round >= next_checkpoint:
+                #snapshots up to the checkpoint have to be on disk before it
+                stats.flush()
+                pop.checkpoint(checkpoint_path)
+                next_checkpoint += checkpoint_freq
+        stats.append(pop)
+    finally:
+        stats.close()
+    return pop
+
+if __name__ == "__main__":
+    # stats.py [stats file [checkpoint file]]
+    stats_path = len(sys.argv) > 1 and sys.argv[1] or "stats.bin"
+    checkpoint_path = len(sys.argv) > 2 and sys.argv[2] or "had.ckpt"
+    config = had.Config(species={had.Hawk: 0.5, had.Dove: 0.5}, pop_size=1000000, rounds=10000000,
+                        stats_freq=100000)
+    run(config, batch_size=10000, stats_path=stats_path, checkpoint_path=checkpoint_path,
+        checkpoint_freq=1000000)
+    names, dtype, records = read_snapshots(stats_path)
+    for record in records[-5:]:
+        print record["round"], dict(zip(names, record["counts"].tolist())), record["top_fitness"][:3]
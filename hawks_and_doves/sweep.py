@@ -0,0 +1,110 @@
+"""
+Parameter sweep of the "hawks and doves" simulation.
+
+Every point of the grid (payoff matrix x initial species mix x evo replace probability x seed)
+is simulated by the batched array population in a worker process. Run stops early once
+species ratios settle - max change of every species fraction over the last window of
+snapshots is below tolerance. Results go to a columnar .npz or .csv file.
+"""
+
+import csv
+import itertools
+import sys
+from multiprocessing import Pool
+import numpy
+
+import had
+from array_pop import ArrayPop
+
+class SweepPoint(object):
+    """
+    Parameters of one simulation in the sweep
+    """
+    def __init__(self, matrix_index, mix_index, config, seed):
+        self.matrix_index = matrix_index
+        self.mix_index = mix_index
+        self.config = config
+        self.seed = seed
+
+def simulate(point, batch_size=100, window=10, tolerance=0.02):
+    """
+    Runs one sweep point until config.rounds or equilibrium. Returns result row (dict).
+    """
+    config = point.config
+    pop = ArrayPop(config.species, config.pop_size, point.seed, config)
+    history = []
+    converged = False
+    next_snapshot = 0
+    while pop.round < config.rounds:
+        pop.perform_fights(min(batch_size, config.rounds - pop.round))
+        if pop.round >= next_snapshot:
+            next_snapshot += config.stats_freq
+            history.append(pop.counts / float(pop.counts.sum()))
+            recent = numpy.array(history[-window:])
+            if len(recent) == window and (recent.max(axis=0) - recent.min(axis=0)).max() < tolerance:
+                converged = True
+                break
+    row = {
+           "matrix": point.matrix_index,
+           "mix": point.mix_index,
+           "evo_replace_prob": config.evo_replace_prob,
+           "seed": point.seed,
+           "rounds": pop.round,
+           "converged": converged,
+          }
+    for code, species in enumerate(pop.species):
+        row[species.get_name()] = pop.counts[code] / float(pop.counts.sum())
+    return row
+
+def _simulate(args):
+    return simulate(*args)
+
+def make_points(payoff_matrices, species_mixes, replace_probs, seeds, **config_params):
+    points = []
+    for (matrix_index, matrix), (mix_index, mix), replace_prob, seed in itertools.product(
+            enumerate(payoff_matrices), enumerate(species_mixes), replace_probs, seeds):
+        config = had.Config(payoff_matrix=matrix, species=mix, evo_replace_prob=replace_prob, **config_params)
+        points.append(SweepPoint(matrix_index, mix_index, config, seed))
+    return points
+
+def sweep(payoff_matrices, species_mixes, replace_probs, seeds, processes=None,
+          batch_size=100, window=10, tolerance=0.02, **config_params):
+    """
+    Simulates all the grid points in a process pool, returns result rows in grid order.
+    config_params (pop_size, rounds, ...) are shared by all points.
+    """
+    points = make_points(payoff_matrices, species_mixes, replace_probs, seeds, **config_params)
+    pool = Pool(processes)
+    try:
+        return pool.map(_simulate, [(point, batch_size, window, tolerance) for point in points], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def write_results(rows, path):
+    """
+    Stores rows column by column - numpy .npz or .csv according to the extension.
+    Mixes may differ in species, fraction of species missing in a row is 0.
+    """
+    columns = sorted(set(column for row in rows for column in row))
+    if path.endswith(".npz"):
+        numpy.savez_compressed(path, **dict((column, numpy.array([row.get(column, 0.0) for row in rows]))
+                                           for column in columns))
+    else:
+        f = open(path, "wb")
+        try:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([row.get(column, 0.0) for column in columns])
+        finally:
+            f.close()
+
+if __name__ == "__main__":
+    matrices = [had.make_payoff_matrix(fight_cost=cost) for cost in [-10, -20, -30, -40]]
+    #replaced individuals are drawn from the species of the mix, so these are hawks against doves
+    mixes = [{had.Hawk: 0.5, had.Dove: 0.5}, {had.Hawk: 0.1, had.Dove: 0.9}]
+    rows = sweep(matrices, mixes, [0.05, 0.1], range(4), pop_size=1000, rounds=1000000)
+    write_results(rows, len(sys.argv) > 1 and sys.argv[1] or "sweep.csv")
+    for row in rows:
+        print row
@@ -1,19 +1,95 @@
 
-import Image, ImageDraw
+"""
+Draws routes of mail.cc solver (routes.txt) to png.
+
+First line of routes file are centers separated by CENTER_SEP, every next line one route
+of cities separated by ROUTE_SEP. City number is row * width + col.
+
+Routes are parsed in chunks of CHUNK_SIZE lines. draw_routes draws them by PIL through one
+ImageDraw context, render_routes rasterizes whole chunks of road segments into numpy array
+at once. render_routes can also split big images into tiles (each tile is rendered by its own
+pass over the routes file, so only one tile is in memory) and downsample large worlds
+(img_size smaller than world - many cities per pixel).
+"""
+
+import sys
 import random
+import numpy
+
+try:
+    import Image, ImageDraw
+except ImportError:
+    from PIL import Image, ImageDraw
 
 ROUTES_FN = "routes.txt"
+OUTPUT_FN = "world.png"
 CENTER_SEP = " "
 ROUTE_SEP = "->"
 EDGE_SIZE = 20
-IMG_SIZE = 640 
+IMG_SIZE = 640
 WORLD_SIZE = 32
-UNIT = IMG_SIZE / float(WORLD_SIZE)
+CHUNK_SIZE = 1024
+CENTER_SIZE = 5
+CITY_SIZE = 1
+
+class World(object):
+    """
+    Maps cities of width x height world to pixels of image with longer side img_size
+    (plus edge_size margin)
+    """
+    def __init__(self, width=WORLD_SIZE, height=WORLD_SIZE, img_size=IMG_SIZE, edge_size=EDGE_SIZE):
+        self.width = width
+        self.height = height
+        self.edge_size = edge_size
+        self.unit = img_size / float(max(width, height))
+        self.img_width = int(round(width * self.unit)) + 2 * edge_size
+        self.img_height = int(round(height * self.unit)) + 2 * edge_size
+
+    def make_pt(self, city):
+        city = int(city)
+        return (self.edge_size + city % self.width * self.unit, self.edge_size + city / self.width * self.unit)
+
+    def make_pts(self, cities):
+        """
+        Vectorized make_pt - array of cities to len(cities) x 2 array of (x, y)
+        """
+        cities = numpy.asarray(cities, dtype=numpy.int64)
+        return numpy.column_stack([cities % self.width, cities / self.width]) * self.unit + self.edge_size
+
+    def marker_size(self, size):
+        #markers shrink to single pixels in downsampled worlds
+        return min(size, int(self.unit / 4))
+
+def _parse_chunk(lines):
+    """
+    Routes of lines as (cities, lengths) arrays - cities of all the routes concatenated
+    """
+    lengths = numpy.array([line.count(ROUTE_SEP) + 1 for line in lines], dtype=numpy.int64)
+    cities = numpy.array(" ".join(lines).replace(ROUTE_SEP, " ").split(), dtype=numpy.int64)
+    return cities, lengths
 
-def _make_pt(city):
-    pt = (int(city) % WORLD_SIZE, int(city) / WORLD_SIZE)
-    pt = (EDGE_SIZE + pt[0] * UNIT, EDGE_SIZE + pt[1] * UNIT)
-    return pt
+def read_routes(f, chunk_size=CHUNK_SIZE):
+    """
+    Returns (centers, chunks) - chunks is generator of up to chunk_size routes parsed
+    to (cities, lengths) arrays
+    """
+    centers = [int(city) for city in f.readline().split()]
+    def chunks():
+        lines = []
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                yield _parse_chunk(lines)
+                lines = []
+        if lines:
+            yield _parse_chunk(lines)
+    return centers, chunks()
+
+def split_routes(cities, lengths):
+    return numpy.split(cities, numpy.cumsum(lengths)[:-1])
 
 def _draw_city(draw, pt, color, size=1):
     draw.rectangle((pt[0] - size, pt[1] - size, pt[0] + size, pt[1] + size), fill=color)
@@ -25,35 +101,142 @@ def _draw_road(draw, pt_from, pt_to, color, direct=False):
         draw.line((pt_from[0], pt_from[1], pt_from[0], pt_to[1]), fill=color, width=0)
         draw.line((pt_from[0], pt_to[1], pt_to[0], pt_to[1]), fill=color, width=0)
 
-def draw_routes(): 
+def draw_routes(routes_fn=ROUTES_FN, output_fn=OUTPUT_FN, world=None, direct=True):
+    world = world or World()
+    im = Image.new("RGB", (world.img_width, world.img_height), "#FFFFFF")
+    draw = ImageDraw.Draw(im)
 
-    im = Image.new("RGB", (IMG_SIZE + 2 * EDGE_SIZE, IMG_SIZE + 2 * EDGE_SIZE), "#FFFFFF")
+    f = open(routes_fn, "r")
+    try:
+        centers, chunks = read_routes(f)
+        # draw centers
+        for pt in map(world.make_pt, centers):
+            _draw_city(draw, pt, "black", size=world.marker_size(CENTER_SIZE))
 
-    f = open(ROUTES_FN, "r")
-    
-    # draw centers
-    points = map(_make_pt, f.readline().strip().split(CENTER_SEP))
-    for pt in points:
-        _draw_city(ImageDraw.Draw(im), pt, "black", size=5)
+        # draw routes
+        city_size = world.marker_size(CITY_SIZE)
+        for cities, lengths in chunks:
+            for route in split_routes(cities, lengths):
+                points = map(world.make_pt, route.tolist())
+                pt_from = points[0]
+                color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+                _draw_city(draw, pt_from, color, city_size)
+                for pt_to in points[1:]:
+                    _draw_road(draw, pt_from, pt_to, color, direct)
+                    _draw_city(draw, pt_to, color, city_size)
+                    pt_from = pt_to
+    finally:
+        f.close()
 
+    im.save(output_fn)
 
-    line = f.readline()
-    # draw routes
-    while line:
-        points = map(_make_pt, line.split(ROUTE_SEP))
-        pt_from = points[0]
-        color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-        draw = ImageDraw.Draw(im)
-        _draw_city(draw, pt_from, color)
-        for pt_to in points[1:]:
-            _draw_road(draw, pt_from, pt_to, color, True)
-            _draw_city(draw, pt_to, color)
-            pt_from = pt_to
-        line = f.readline()
+class Raster(object):
+    """
+    RGB numpy raster of one tile of the image - pixels [x0, x0 + width) x [y0, y0 + height)
+    """
+    def __init__(self, x0, y0, width, height):
+        self.x0 = x0
+        self.y0 = y0
+        self.pixels = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.pixels.fill(255)
 
-    # write to stdout
-    im.save("world.png")
+    def plot(self, xs, ys, colors):
+        """
+        Sets pixels (xs[i], ys[i]) to colors[i], pixels outside of the tile are skipped
+        """
+        height, width = self.pixels.shape[:2]
+        xs = numpy.round(xs).astype(numpy.int64) - self.x0
+        ys = numpy.round(ys).astype(numpy.int64) - self.y0
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        self.pixels[ys[inside], xs[inside]] = colors[inside]
 
-if __name__ == "__main__":
-    draw_routes()
+    def draw_lines(self, pts_from, pts_to, colors):
+        """
+        Rasterizes all the segments at once - every segment is sampled once per pixel
+        of its longer axis
+        """
+        if not len(pts_from):
+            return
+        deltas = pts_to - pts_from
+        steps = numpy.ceil(numpy.abs(deltas).max(axis=1)).astype(numpy.int64) + 1
+        segments = numpy.repeat(numpy.arange(len(steps)), steps)
+        starts = numpy.cumsum(steps) - steps
+        ts = (numpy.arange(len(segments)) - starts[segments]) / numpy.maximum(steps - 1, 1)[segments].astype(numpy.float64)
+        pts = pts_from[segments] + deltas[segments] * ts[:, None]
+        self.plot(pts[:, 0], pts[:, 1], colors[segments])
+
+    def draw_markers(self, pts, colors, size):
+        for dx in xrange(-size, size + 1):
+            for dy in xrange(-size, size + 1):
+                self.plot(pts[:, 0] + dx, pts[:, 1] + dy, colors)
 
+    def save(self, output_fn):
+        Image.fromarray(self.pixels, "RGB").save(output_fn)
+
+def _render_chunk(raster, world, cities, lengths, colors, direct):
+    pts = world.make_pts(cities)
+    point_colors = numpy.repeat(colors, lengths, axis=0)
+    #segment from every point but the last one of its route
+    is_last = numpy.zeros(len(pts), dtype=bool)
+    is_last[numpy.cumsum(lengths) - 1] = True
+    pts_from, pts_to, segment_colors = pts[~is_last], pts[numpy.roll(~is_last, 1)], point_colors[~is_last]
+    if direct:
+        raster.draw_lines(pts_from, pts_to, segment_colors)
+    else:
+        corners = numpy.column_stack([pts_from[:, 0], pts_to[:, 1]])
+        raster.draw_lines(pts_from, corners, segment_colors)
+        raster.draw_lines(corners, pts_to, segment_colors)
+    raster.draw_markers(pts, point_colors, world.marker_size(CITY_SIZE))
+
+def render_tile(routes_fn, world, x0, y0, width, height, direct=True, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    Raster of one tile of the image. Route colors depend only on the seed, so they are
+    the same in all tiles.
+    """
+    raster = Raster(x0, y0, width, height)
+    rng = numpy.random.RandomState(seed)
+    f = open(routes_fn, "r")
+    try:
+        centers, chunks = read_routes(f, chunk_size)
+        for cities, lengths in chunks:
+            colors = rng.randint(0, 256, (len(lengths), 3)).astype(numpy.uint8)
+            _render_chunk(raster, world, cities, lengths, colors, direct)
+        if centers:
+            raster.draw_markers(world.make_pts(centers), numpy.zeros((len(centers), 3), dtype=numpy.uint8),
+                                world.marker_size(CENTER_SIZE))
+    finally:
+        f.close()
+    return raster
+
+def render_routes(routes_fn=ROUTES_FN, output_fn=OUTPUT_FN, world=None, tile_size=None, direct=True, seed=0):
+    """
+    Renders routes by numpy rasterization. With tile_size the image is split into tiles
+    of at most tile_size x tile_size pixels saved as <output>_<row>_<col>.<ext>.
+    Returns list of written files.
+    """
+    world = world or World()
+    if not tile_size:
+        render_tile(routes_fn, world, 0, 0, world.img_width, world.img_height, direct, seed).save(output_fn)
+        return [output_fn]
+    dot = output_fn.rfind(".")
+    base, ext = (output_fn[:dot], output_fn[dot:]) if dot > 0 else (output_fn, ".png")
+    written = []
+    for row, y0 in enumerate(xrange(0, world.img_height, tile_size)):
+        for col, x0 in enumerate(xrange(0, world.img_width, tile_size)):
+            raster = render_tile(routes_fn, world, x0, y0, min(tile_size, world.img_width - x0),
+                                 min(tile_size, world.img_height - y0), direct, seed)
+            tile_fn = "%s_%d_%d%s" % (base, row, col, ext)
+            raster.save(tile_fn)
+            written.append(tile_fn)
+    return written
+
+if __name__ == "__main__":
+    # draw.py [routes file [output file [width [height [img size [tile size]]]]]]
+    args = sys.argv[1:]
+    routes_fn = len(args) > 0 and args[0] or ROUTES_FN
+    output_fn = len(args) > 1 and args[1] or OUTPUT_FN
+    width = len(args) > 2 and int(args[2]) or WORLD_SIZE
+    height = len(args) > 3 and int(args[3]) or width
+    img_size = len(args) > 4 and int(args[4]) or IMG_SIZE
+    tile_size = len(args) > 5 and int(args[5]) or None
+    render_routes(routes_fn, output_fn, World(width, height, img_size), tile_size)
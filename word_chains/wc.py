@@ -1,4 +1,12 @@
+import mmap
+import struct
 import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from heapq import heappop, heappush
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 
 class OptDict(dict):
     def __setitem__(self, key, value):
@@ -6,8 +14,16 @@ class OptDict(dict):
         #dict.__setitem__(self, key, value)
 
     def __getitem__(self, key):
+        #words are looked up in their length sub-dict, lengths directly
+        if isinstance(key, basestring):
+            return dict.__getitem__(self, len(key))[key]
         return dict.__getitem__(self, key)
 
+    def __contains__(self, key):
+        if isinstance(key, basestring):
+            return dict.__contains__(self, len(key)) and key in dict.__getitem__(self, len(key))
+        return dict.__contains__(self, key)
+
 def build_opt_dict(fh):
     """
     Creates dictionary indexed by length and then by words
@@ -20,45 +36,537 @@ def build_opt_dict(fh):
 
     return d
 
+class WordBlock(object):
+    """
+    Sorted words of one length back to back in one buffer (str or mmap), word id is
+    its index. Membership is binary search over the buffer.
+    """
+    def __init__(self, word_len, buffer, count, offset=0):
+        self.word_len = word_len
+        self.buffer = buffer
+        self.count = count
+        self.offset = offset
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, word_id):
+        if not 0 <= word_id < self.count:
+            raise IndexError(word_id)
+        start = self.offset + word_id * self.word_len
+        return self.buffer[start:start + self.word_len]
+
+    def __iter__(self):
+        for word_id in xrange(self.count):
+            yield self[word_id]
+
+    def word_id(self, word):
+        """
+        Id of word or None
+        """
+        word_id = bisect_left(self, word)
+        if word_id < self.count and self[word_id] == word:
+            return word_id
+        return None
+
+    def __contains__(self, word):
+        return len(word) == self.word_len and self.word_id(word) is not None
+
+#compact dictionary file: header, block headers, then words of all blocks
+DICT_MAGIC = "WDIC"
+DICT_VERSION = 1
+#magic, version, blocks num
+_DICT_HEADER = struct.Struct("<4sHI")
+#word length, words num
+_BLOCK_HEADER = struct.Struct("<II")
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+class CompactDict(object):
+    """
+    Words by length in WordBlocks - few big strings instead of a dict entry per word.
+    Loaded file is mmap'd read only, so processes using the same file share its pages.
+    """
+    def __init__(self, blocks, data=None):
+        self.blocks = dict((block.word_len, block) for block in blocks)
+        self._data = data
+
+    def __contains__(self, word):
+        block = self.blocks.get(len(word))
+        return block is not None and block.word_id(word) is not None
+
+    def __len__(self):
+        return sum(len(block) for block in self.blocks.itervalues())
+
+    def word_id(self, word):
+        block = self.blocks.get(len(word))
+        return block.word_id(word) if block is not None else None
+
+    def words(self, word_len):
+        block = self.blocks.get(word_len)
+        return iter(block) if block else iter(())
+
+    @classmethod
+    def from_file(cls, fh, chunk_size=READ_CHUNK_SIZE):
+        """
+        Reads fh in big chunks (no per line reads), same normalization as build_opt_dict
+        """
+        by_len = {}
+        rest = ""
+        while True:
+            chunk = fh.read(chunk_size)
+            lines = (rest + chunk).lower().split("\n")
+            rest = lines.pop() if chunk else ""
+            for line in lines:
+                word = line.strip()
+                if word:
+                    by_len.setdefault(len(word), set()).add(word)
+            if not chunk:
+                break
+        return cls([WordBlock(word_len, "".join(sorted(words)), len(words))
+                    for word_len, words in by_len.iteritems()])
+
+    def save(self, path):
+        f = open(path, "wb")
+        try:
+            blocks = [block for word_len, block in sorted(self.blocks.items())]
+            f.write(_DICT_HEADER.pack(DICT_MAGIC, DICT_VERSION, len(blocks)))
+            for block in blocks:
+                f.write(_BLOCK_HEADER.pack(block.word_len, len(block)))
+            for block in blocks:
+                f.write(block.buffer[block.offset:block.offset + block.word_len * len(block)])
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, path):
+        f = open(path, "rb")
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        magic, version, blocks_num = _DICT_HEADER.unpack(data[:_DICT_HEADER.size])
+        if magic != DICT_MAGIC:
+            raise ValueError("%s: not a compact dictionary" % path)
+        if version != DICT_VERSION:
+            raise ValueError("%s: unsupported compact dictionary version %d" % (path, version))
+        blocks = []
+        offset = _DICT_HEADER.size + blocks_num * _BLOCK_HEADER.size
+        for i in xrange(blocks_num):
+            word_len, count = _BLOCK_HEADER.unpack_from(data, _DICT_HEADER.size + i * _BLOCK_HEADER.size)
+            blocks.append(WordBlock(word_len, data, count, offset))
+            offset += word_len * count
+        return cls(blocks, data)
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+WILDCARD = "*"
+
 def gen_variations(word):
     for pos in xrange(len(word)):
         for i in xrange(26):
             c = chr(ord("a") + i)
             yield word[:pos] + str(c) + word[pos+1:]
 
-def find_word_chain(start, end, opt_dict):
+def gen_patterns(word):
+    """
+    Word with one letter replaced by wildcard, i.e. robot -> *obot, r*bot, ...
+    """
+    for pos in xrange(len(word)):
+        yield word[:pos] + WILDCARD + word[pos+1:]
+
+def build_pattern_index(words):
+    """
+    Maps every pattern to the words matching it - words sharing a pattern are neighbours
+    """
+    index = {}
+    for word in words:
+        for pattern in gen_patterns(word):
+            index.setdefault(pattern, []).append(word)
+    return index
+
+def _expand_layer(queue, visited, other_visited, neighbours):
+    """
+    Expands whole BFS layer, returns node where both searches meet or None
+    """
+    for _ in xrange(len(queue)):
+        node = queue.popleft()
+        for neighbour in neighbours(node):
+            if neighbour in visited:
+                continue
+            visited[neighbour] = node
+            if neighbour in other_visited:
+                return neighbour
+            queue.append(neighbour)
+    return None
+
+def _bidirectional_bfs(start, end, neighbours):
+    """
+    Shortest path from start to end as list of nodes or None if there is none.
+    All the search state is local, so the graph is never modified.
+    """
+    if start == end:
+        return [start]
+    #parent pointers towards start and towards end
+    forward, backward = {start: None}, {end: None}
+    forward_queue, backward_queue = deque([start]), deque([end])
+    meet = None
+    while forward_queue and backward_queue and meet is None:
+        #grow the smaller frontier
+        if len(forward_queue) <= len(backward_queue):
+            meet = _expand_layer(forward_queue, forward, backward, neighbours)
+        else:
+            meet = _expand_layer(backward_queue, backward, forward, neighbours)
+    if meet is None:
+        return None
+
+    path = []
+    node = meet
+    while node is not None:
+        path.append(node)
+        node = forward[node]
+    path.reverse()
+    node = backward[meet]
+    while node is not None:
+        path.append(node)
+        node = backward[node]
+    return path
+
+def find_word_chain(start, end, pattern_index):
+    """
+    Bidirectional BFS over pattern index of words of the same length as start and end.
+    Returns shortest chain as list of words or None if there is none.
+    """
     assert(len(start) == len(end))
-    sub_dict = opt_dict[len(start)]
-    opt_dict["dog"] = False
-    queue = [(start, 0)]
-    while queue:
-        #N^2 !
-        word, layer = queue.pop(0)
-
-        for variation in gen_variations(word):
-            if variation == end:
-                print "found in %d layers" % (layer + 1)
-                backtrace = [end]
-                back_word = word
-                while back_word != start:
-                    backtrace.append(back_word)
-                    back_word = sub_dict[back_word]
-                backtrace.append(start)
-                backtrace.reverse()
-                print "backtrace:"," ".join(backtrace)
-                return
-            val = sub_dict.get(variation, True)  
-            if val:
+    def neighbours(word):
+        for pattern in gen_patterns(word):
+            for neighbour in pattern_index.get(pattern, ()):
+                yield neighbour
+    return _bidirectional_bfs(start, end, neighbours)
+
+#distance in landmark tables for words not reachable from the landmark
+UNREACHABLE = 0xFFFF
+
+class WordLayer(object):
+    """
+    Graph of words of one length. Words are numbered by their sorted order, neighbours of
+    word i are neighbours[offsets[i]:offsets[i + 1]].
+
+    components[i] is label of connected component of word i. Optional landmark tables hold
+    BFS distances from few landmark words (landmark-major), they give A* lower bounds.
+    """
+    def __init__(self, word_len, words, offsets, neighbours, components=None,
+                 landmarks=None, landmark_distances=None):
+        self.word_len = word_len
+        self.words = words
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.ids = dict((word, i) for i, word in enumerate(words))
+        self.components = components if components is not None else self._label_components()
+        self.landmarks = landmarks if landmarks is not None else array("I")
+        self.landmark_distances = landmark_distances if landmark_distances is not None else array("H")
+
+    def __reduce__(self):
+        #ids are cheap to rebuild, no need to pickle them
+        return (self.__class__, (self.word_len, self.words, self.offsets, self.neighbours,
+                                 self.components, self.landmarks, self.landmark_distances))
+
+    @classmethod
+    def from_words(cls, word_len, words, landmarks_num=0):
+        words = sorted(words)
+        ids = dict((word, i) for i, word in enumerate(words))
+        pattern_index = build_pattern_index(words)
+        offsets = array("I", [0])
+        neighbours = array("I")
+        for word in words:
+            word_neighbours = set()
+            for pattern in gen_patterns(word):
+                word_neighbours.update(pattern_index[pattern])
+            word_neighbours.discard(word)
+            neighbours.extend(sorted(ids[neighbour] for neighbour in word_neighbours))
+            offsets.append(len(neighbours))
+        layer = cls(word_len, words, offsets, neighbours)
+        if landmarks_num:
+            layer.build_landmarks(landmarks_num)
+        return layer
+
+    def get_neighbours(self, word_id):
+        return self.neighbours[self.offsets[word_id]:self.offsets[word_id + 1]]
+
+    def _distances_from(self, word_id):
+        distances = array("H", [UNREACHABLE]) * len(self.words)
+        distances[word_id] = 0
+        queue = deque([word_id])
+        while queue:
+            node = queue.popleft()
+            for neighbour in self.get_neighbours(node):
+                if distances[neighbour] == UNREACHABLE:
+                    distances[neighbour] = distances[node] + 1
+                    queue.append(neighbour)
+        return distances
+
+    def _label_components(self):
+        components = array("I", [0]) * len(self.words)
+        labeled = [False] * len(self.words)
+        label = 0
+        for root in xrange(len(self.words)):
+            if labeled[root]:
+                continue
+            labeled[root] = True
+            components[root] = label
+            queue = deque([root])
+            while queue:
+                for neighbour in self.get_neighbours(queue.popleft()):
+                    if not labeled[neighbour]:
+                        labeled[neighbour] = True
+                        components[neighbour] = label
+                        queue.append(neighbour)
+            label += 1
+        return components
+
+    def build_landmarks(self, landmarks_num):
+        """
+        Picks landmarks in the largest component - first the best connected word,
+        then always the word farthest from landmarks picked so far.
+        """
+        if not self.words:
+            return
+        sizes = {}
+        for label in self.components:
+            sizes[label] = sizes.get(label, 0) + 1
+        largest = max(sizes, key=sizes.get)
+        members = [i for i in xrange(len(self.words)) if self.components[i] == largest]
+        landmark = max(members, key=lambda i: self.offsets[i + 1] - self.offsets[i])
+        self.landmarks = array("I")
+        self.landmark_distances = array("H")
+        nearest = None
+        for _ in xrange(min(landmarks_num, len(members))):
+            distances = self._distances_from(landmark)
+            self.landmarks.append(landmark)
+            self.landmark_distances.extend(distances)
+            if nearest is None:
+                nearest = distances
+            else:
+                nearest = array("H", map(min, nearest, distances))
+            landmark = max(members, key=nearest.__getitem__)
+
+    def lower_bound(self, start_id, end_id):
+        """
+        Lower bound of chain length by triangle inequality: |d(l, start) - d(l, end)| <= d(start, end)
+        """
+        words_num = len(self.words)
+        distances = self.landmark_distances
+        bound = 0
+        for i in xrange(len(self.landmarks)):
+            d_start, d_end = distances[i * words_num + start_id], distances[i * words_num + end_id]
+            if d_start != UNREACHABLE and d_end != UNREACHABLE:
+                bound = max(bound, abs(d_start - d_end))
+        return bound
+
+    def connected(self, start_id, end_id):
+        return self.components[start_id] == self.components[end_id]
+
+    def _astar(self, start_id, end_id):
+        parents, costs = {start_id: None}, {start_id: 0}
+        heap = [(self.lower_bound(start_id, end_id), 0, start_id)]
+        while heap:
+            _, cost, node = heappop(heap)
+            if node == end_id:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                path.reverse()
+                return path
+            if cost > costs[node]:
                 continue
-            sub_dict[variation] = word
-            queue.append((variation, layer+1))
+            for neighbour in self.get_neighbours(node):
+                if cost + 1 < costs.get(neighbour, UNREACHABLE):
+                    costs[neighbour] = cost + 1
+                    parents[neighbour] = node
+                    heappush(heap, (cost + 1 + self.lower_bound(neighbour, end_id), cost + 1, neighbour))
+        return None
 
-    print "not found"
+    def find_chain(self, start, end, astar=False):
+        """
+        astar uses landmark lower bounds - it visits fewer words, but bidirectional BFS
+        is usually faster in python unless there are many landmarks
+        """
+        ids = self.ids
+        if start not in ids or end not in ids:
+            return None
+        start_id, end_id = ids[start], ids[end]
+        if not self.connected(start_id, end_id):
+            return None
+        if astar and self.landmarks:
+            path = self._astar(start_id, end_id)
+        else:
+            path = _bidirectional_bfs(start_id, end_id, self.get_neighbours)
+        return path and [self.words[word_id] for word_id in path]
+
+def _build_layer(args):
+    return WordLayer.from_words(*args)
+
+#cache file: header, then for every layer its header, words, offsets and neighbours
+CACHE_MAGIC = "WGRC"
+CACHE_VERSION = 2
+#magic, version, layers num
+_CACHE_HEADER = struct.Struct("<4sHI")
+#word length, words num, neighbours num, landmarks num
+_LAYER_HEADER = struct.Struct("<IIII")
+
+class WordGraph(object):
+    """
+    Word graphs of all word lengths built once for many chain queries.
+    Graph is read only after construction, so queries can run concurrently.
+    """
+    def __init__(self, layers):
+        self.layers = dict((layer.word_len, layer) for layer in layers)
+
+    @classmethod
+    def from_opt_dict(cls, opt_dict, landmarks_num=0, processes=None):
+        """
+        Builds layers (adjacency, components and landmark tables) in a process pool,
+        one task per word length - longest layers first to balance the pool.
+        """
+        return cls._from_words_by_len([(word_len, words.keys()) for word_len, words in opt_dict.items()],
+                                      landmarks_num, processes)
+
+    @classmethod
+    def from_compact_dict(cls, compact_dict, landmarks_num=0, processes=None):
+        return cls._from_words_by_len([(word_len, list(block)) for word_len, block in compact_dict.blocks.items()],
+                                      landmarks_num, processes)
+
+    @classmethod
+    def _from_words_by_len(cls, words_by_len, landmarks_num, processes):
+        tasks = [(word_len, words, landmarks_num) for word_len, words in
+                    sorted(words_by_len, key=lambda item: len(item[1]), reverse=True)]
+        pool = Pool(processes)
+        try:
+            return cls(pool.map(_build_layer, tasks, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _get_ids(self, start, end):
+        """
+        Layer and ids of both words or None if they don't exist or differ in length
+        """
+        layer = self.layers.get(len(start))
+        if len(start) != len(end) or layer is None or start not in layer.ids or end not in layer.ids:
+            return None
+        return layer, layer.ids[start], layer.ids[end]
+
+    def connected(self, start, end):
+        """
+        Whether any chain exists - O(1)
+        """
+        found = self._get_ids(start, end)
+        return bool(found) and found[0].connected(found[1], found[2])
+
+    def lower_bound(self, start, end):
+        """
+        Lower bound of chain length (number of steps) or None if there is no chain
+        """
+        if not self.connected(start, end):
+            return None
+        layer, start_id, end_id = self._get_ids(start, end)
+        return layer.lower_bound(start_id, end_id)
+
+    def find_chain(self, start, end, astar=False):
+        """
+        Shortest chain from start to end as list of words or None if there is none
+        """
+        if len(start) != len(end) or len(start) not in self.layers:
+            return None
+        return self.layers[len(start)].find_chain(start, end, astar)
+
+    def find_chains(self, pairs, threads=None):
+        """
+        Answers list of (start, end) queries, optionally in a thread pool
+        """
+        if not threads:
+            return [self.find_chain(start, end) for start, end in pairs]
+        pool = ThreadPool(threads)
+        try:
+            return pool.map(lambda pair: self.find_chain(*pair), pairs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def save(self, path):
+        f = open(path, "wb")
+        try:
+            f.write(_CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(self.layers)))
+            for word_len, layer in sorted(self.layers.items()):
+                f.write(_LAYER_HEADER.pack(word_len, len(layer.words), len(layer.neighbours),
+                                           len(layer.landmarks)))
+                f.write("".join(layer.words))
+                layer.offsets.tofile(f)
+                layer.neighbours.tofile(f)
+                layer.components.tofile(f)
+                layer.landmarks.tofile(f)
+                layer.landmark_distances.tofile(f)
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, path):
+        f = open(path, "rb")
+        try:
+            magic, version, layers_num = _CACHE_HEADER.unpack(f.read(_CACHE_HEADER.size))
+            if magic != CACHE_MAGIC:
+                raise ValueError("%s: not a word graph cache" % path)
+            if version != CACHE_VERSION:
+                raise ValueError("%s: unsupported word graph cache version %d" % (path, version))
+            layers = []
+            for _ in xrange(layers_num):
+                word_len, words_num, neighbours_num, landmarks_num = \
+                    _LAYER_HEADER.unpack(f.read(_LAYER_HEADER.size))
+                blob = f.read(word_len * words_num)
+                words = [blob[i:i + word_len] for i in xrange(0, len(blob), word_len)]
+                offsets = array("I")
+                offsets.fromfile(f, words_num + 1)
+                neighbours = array("I")
+                neighbours.fromfile(f, neighbours_num)
+                components = array("I")
+                components.fromfile(f, words_num)
+                landmarks = array("I")
+                landmarks.fromfile(f, landmarks_num)
+                landmark_distances = array("H")
+                landmark_distances.fromfile(f, landmarks_num * words_num)
+                layers.append(WordLayer(word_len, words, offsets, neighbours, components,
+                                        landmarks, landmark_distances))
+        finally:
+            f.close()
+        return cls(layers)
+
+WORDS_FN = "words.txt"
+DICT_FN = "words.wdc"
+CACHE_FN = "words.wgc"
+LANDMARKS_NUM = 4
 
 if __name__ == "__main__":
     t = time.time()
-    opt_dict = build_opt_dict(open("words.txt", "r"))
-    find_word_chain("robot", "coder", opt_dict)
+    try:
+        graph = WordGraph.load(CACHE_FN)
+    except (IOError, ValueError):
+        try:
+            compact_dict = CompactDict.load(DICT_FN)
+        except (IOError, ValueError):
+            compact_dict = CompactDict.from_file(open(WORDS_FN, "r"))
+            compact_dict.save(DICT_FN)
+        graph = WordGraph.from_compact_dict(compact_dict, LANDMARKS_NUM)
+        graph.save(CACHE_FN)
+    print "prepared word graph in %s" % (time.time() - t)
+    t = time.time()
+    chain = graph.find_chain("robot", "coder")
+    if chain:
+        print "found in %d layers" % (len(chain) - 1)
+        print "backtrace:"," ".join(chain)
+    else:
+        print "not found"
     print "spent %s in search" % (time.time() - t)
     #print opt_dict
-
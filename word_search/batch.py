@@ -0,0 +1,107 @@
+"""
+Batch generation of word search puzzles.
+
+Puzzles are generated in a process pool, puzzle i is generated with its own
+random.Random(seed + i), so every puzzle of a batch can be reproduced alone.
+Finished puzzles are streamed to a text file in order, one record per puzzle:
+
+    seed edge words_num
+    edge rows of letters
+    words_num lines "word row col direction"
+    empty line
+
+Optionally every puzzle is verified and rated by the trie solver.
+"""
+
+import sys
+import random
+from multiprocessing import Pool
+
+import wordsearch
+import solver
+
+BATCH_FN = "puzzles.txt"
+
+#per worker process state, set by _init_worker
+_words = None
+_trie = None
+
+def _init_worker(words, verify):
+    global _words, _trie
+    _words = words
+    _trie = verify and solver.Trie(word for word in words if word) or None
+
+def make_seeded_puzzle(edge, words, seed, max_steps=wordsearch.MAX_STEPS):
+    return wordsearch.make_puzzle(edge, words, random.Random(seed), max_steps)
+
+def _generate(args):
+    edge, seed, max_steps = args
+    puzzle, placed = make_seeded_puzzle(edge, _words, seed, max_steps)
+    stats = None
+    if _trie is not None:
+        found = solver.solve(puzzle, edge, _trie)
+        stats = solver.difficulty(puzzle, edge, placed, found)
+        stats["missing"] = len(solver.verify(puzzle, edge, placed, found))
+    return seed, puzzle, placed, stats
+
+def write_puzzle(fp, seed, edge, puzzle, placed):
+    fp.write("%d %d %d\n" % (seed, edge, len(placed)))
+    for i in xrange(edge):
+        fp.write(''.join(puzzle[i * edge: (i + 1) * edge]) + "\n")
+    for word, row, col, direction in placed:
+        fp.write("%s %d %d %d\n" % (word, row, col, direction))
+    fp.write("\n")
+
+def read_puzzles(fp):
+    """
+    Generator of (seed, edge, puzzle, placed) records written by write_puzzle
+    """
+    while True:
+        header = fp.readline()
+        if not header:
+            return
+        if not header.strip():
+            continue
+        seed, edge, words_num = map(int, header.split())
+        puzzle = list(''.join(fp.readline().strip() for _ in xrange(edge)))
+        placed = []
+        for _ in xrange(words_num):
+            word, row, col, direction = fp.readline().split()
+            placed.append((word, int(row), int(col), int(direction)))
+        yield seed, edge, puzzle, placed
+
+def generate_batch(fn, num, edge, words, seed=0, processes=None, verify=False,
+                   max_steps=wordsearch.MAX_STEPS):
+    """
+    Generates num puzzles with seeds seed .. seed + num - 1 and streams them to file fn.
+    Returns list of solver stats (difficulty + count of placed words the solver missed)
+    of the puzzles when verify is set.
+    """
+    pool = Pool(processes, _init_worker, (words, verify))
+    fp = open(fn, 'w')
+    all_stats = []
+    try:
+        tasks = ((edge, seed + i, max_steps) for i in xrange(num))
+        for puzzle_seed, puzzle, placed, stats in pool.imap(_generate, tasks, chunksize=4):
+            write_puzzle(fp, puzzle_seed, edge, puzzle, placed)
+            if stats is not None:
+                stats["seed"] = puzzle_seed
+                all_stats.append(stats)
+    finally:
+        fp.close()
+        pool.close()
+        pool.join()
+    return all_stats
+
+if __name__ == '__main__':
+    num = len(sys.argv) > 1 and int(sys.argv[1]) or 100
+    edge = len(sys.argv) > 2 and int(sys.argv[2]) or wordsearch.EDGE
+    fp = open(wordsearch.LIST, 'r')
+    words = [line.strip() for line in fp.readlines()]
+    fp.close()
+    all_stats = generate_batch(BATCH_FN, num, edge, words, verify=True)
+    print 'puzzles:', len(all_stats)
+    print 'not verified:', sum(1 for stats in all_stats if stats["missing"])
+    print 'average score: %.2f' % (sum(stats["score"] for stats in all_stats) / max(len(all_stats), 1))
+    hardest = max(all_stats, key=lambda stats: stats["score"])
+    print 'hardest:', hardest
@@ -0,0 +1,111 @@
+"""
+Word search solver - finds every dictionary word in a grid.
+
+Words are stored in a trie, from every cell and in every of the 8 directions (same order
+as wordsearch.OFFSETS) letters are followed down the trie until there is no word with
+such prefix.
+"""
+
+import sys
+
+from wordsearch import DIRECTIONS, LIST, ANY
+
+#key of the trie node marking end of a word
+END = None
+
+class Trie(object):
+
+    def __init__(self, words=()):
+        self.root = {}
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        node = self.root
+        for c in word:
+            node = node.setdefault(c, {})
+        if END not in node:
+            node[END] = word
+            self.size += 1
+
+    def __contains__(self, word):
+        node = self.root
+        for c in word:
+            node = node.get(c)
+            if node is None:
+                return False
+        return END in node
+
+    @classmethod
+    def from_file(cls, fn=LIST, min_len=1):
+        fp = open(fn, 'r')
+        try:
+            return cls(word for word in (line.strip() for line in fp) if len(word) >= min_len)
+        finally:
+            fp.close()
+
+def solve(puzzle, edge, trie):
+    """
+    All occurrences of trie words in puzzle (flat list or string of edge * edge letters)
+    as list of (word, row, col, direction)
+    """
+    found = []
+    for row in xrange(edge):
+        for col in xrange(edge):
+            first = trie.root.get(puzzle[row * edge + col])
+            if first is None:
+                continue
+            for direction, (dr, dc) in enumerate(DIRECTIONS):
+                node = first
+                r, c = row, col
+                while True:
+                    if END in node:
+                        found.append((node[END], row, col, direction))
+                    r += dr
+                    c += dc
+                    if not (0 <= r < edge and 0 <= c < edge):
+                        break
+                    node = node.get(puzzle[r * edge + c])
+                    if node is None:
+                        break
+    return found
+
+def verify(puzzle, edge, placed, found):
+    """
+    Placements of placed that the solver didn't find (should be empty)
+    """
+    found = set(found)
+    return [placement for placement in placed if placement not in found]
+
+def difficulty(puzzle, edge, placed, found):
+    """
+    Difficulty measures of a puzzle:
+        backwards / diagonal - fraction of placed words read right to left, bottom up or diagonally
+        decoys - occurrences of dictionary words that are not part of the solution
+        score - rough combination of the above, higher is harder
+    """
+    placed_set = set(placed)
+    words = len(placed) or 1
+    backwards = sum(1 for word, row, col, direction in placed
+                    if DIRECTIONS[direction][0] < 0 or DIRECTIONS[direction] == (0, -1))
+    diagonal = sum(1 for word, row, col, direction in placed if 0 not in DIRECTIONS[direction])
+    #single letters and pieces of placed words would be decoys everywhere
+    decoys = sum(1 for placement in found if placement not in placed_set and len(placement[0]) > 2)
+    stats = {
+             "words": len(placed),
+             "empty": list(puzzle).count(ANY),
+             "backwards": float(backwards) / words,
+             "diagonal": float(diagonal) / words,
+             "decoys": decoys,
+            }
+    stats["score"] = stats["backwards"] + stats["diagonal"] + float(decoys) / words
+    return stats
+
+if __name__ == '__main__':
+    #solves puzzle printed by wordsearch.py (rows of letters) from file or stdin
+    fp = len(sys.argv) > 1 and open(sys.argv[1], 'r') or sys.stdin
+    rows = [line.strip() for line in fp if line.strip()]
+    trie = Trie.from_file()
+    for word, row, col, direction in sorted(solve(''.join(rows), len(rows), trie)):
+        print word, row, col, DIRECTIONS[direction]
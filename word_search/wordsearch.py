@@ -1,55 +1,193 @@
-import sys 
+
+import sys
 import random
 
-import psyco
-psyco.full()
+try:
+    import psyco
+    psyco.full()
+except ImportError:
+    pass
 
 EDGE = 10
 LIST = "wordlist.txt"
 OFF = '!'
 ANY = '*'
+MAX_STEPS = 5000
+
+def get_offsets(edge):
+    return [ 1, -1, edge, -edge, edge + 1, edge - 1, -edge + 1, -edge - 1]
+
+OFFSETS = get_offsets(EDGE)
+#(row, col) steps in the same order as OFFSETS
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+DIRECTION_ORDERS = [range(first, 8) + range(first) for first in xrange(8)]
+
+class PuzzleGenerator(object):
+    """
+    Places words longest first with backtracking (depth first search with a step budget),
+    stops as soon as the board is full or there are no candidates left.
+
+    Keeps index of free cells (for random placements) and of cells by letter (for
+    placements crossing already placed words), so candidates are found without
+    scanning the whole board.
+    """
+    def __init__(self, edge, words, rng=random):
+        self.edge = edge
+        self.rng = rng
+        self.words = sorted(set(word for word in words if 0 < len(word) <= edge), key=len, reverse=True)
+        self.puzzle = list(ANY * (edge * edge))
+        #free cells in a list with positions for O(1) removal and random choice
+        self.free = range(edge * edge)
+        self.free_pos = range(edge * edge)
+        self.letter_cells = {}
+        self.placed = []
+
+    def _take(self, pos, c):
+        i = self.free_pos[pos]
+        last = self.free[-1]
+        self.free[i], self.free_pos[last] = last, i
+        self.free.pop()
+        self.puzzle[pos] = c
+        self.letter_cells.setdefault(c, set()).add(pos)
+
+    def _release(self, pos):
+        self.letter_cells[self.puzzle[pos]].discard(pos)
+        self.puzzle[pos] = ANY
+        self.free_pos[pos] = len(self.free)
+        self.free.append(pos)
 
-OFFSETS = [ 1, -1, EDGE, -EDGE, EDGE + 1, EDGE - 1, -EDGE + 1, -EDGE - 1]
-
-def make_puzzle(edge, words):
-    size = edge * edge
-    puzzle = list(ANY * size)
-    placed = [] 
-    for i in xrange(1000000):
-        to_place = random.choice(words)
-        pos = random.randint(0, size)
-        offset = random.choice(OFFSETS) 
-
-        verified = True
-        act_pos = pos
-        for c in to_place:   
-            if act_pos < 0 or act_pos >= size or abs((act_pos + offset) % edge - act_pos % edge) > 1  \
-               or (puzzle[act_pos] != '*' and puzzle[act_pos] != c):
-                verified = False
-                break
-            act_pos += offset
-
-        if verified:
-            placed.append(to_place)
-            act_pos = pos
-            for c in to_place:
-                puzzle[act_pos] = c
-                act_pos += offset
-            words.remove(to_place)
+    def _fits(self, word, row, col, direction):
+        """
+        Whether word fits to (row, col) in direction and covers at least one free cell
+        """
+        dr, dc = DIRECTIONS[direction]
+        last = len(word) - 1
+        if not (0 <= row < self.edge and 0 <= col < self.edge and
+                0 <= row + dr * last < self.edge and 0 <= col + dc * last < self.edge):
+            return False
+        new_cells = 0
+        for i, c in enumerate(word):
+            current = self.puzzle[(row + dr * i) * self.edge + col + dc * i]
+            if current == ANY:
+                new_cells += 1
+            elif current != c:
+                return False
+        return new_cells > 0
 
+    def candidates(self, word, limit, free_tries=64):
+        """
+        Up to limit placements (row, col, direction). Every placement covers a free cell, so once
+        there are fewer free cells than crossings of placed letters, free cells are the anchors,
+        otherwise crossings first and then random free cells.
+        """
+        edge = self.edge
+        found = []
+        seen = set()
+        crossing_num = sum(len(self.letter_cells.get(c, ())) for c in word)
+        if len(self.free) * len(word) <= crossing_num:
+            anchors = [(pos, i) for pos in self.free for i in xrange(len(word))]
+        else:
+            anchors = [(pos, i) for i, c in enumerate(word) for pos in self.letter_cells.get(c, ())]
+        self.rng.shuffle(anchors)
+        for pos, i in anchors:
+            #all directions, starting from a random one
+            first = self.rng.randrange(8)
+            for direction in DIRECTION_ORDERS[first]:
+                dr, dc = DIRECTIONS[direction]
+                candidate = (pos / edge - dr * i, pos % edge - dc * i, direction)
+                if candidate not in seen and self._fits(word, *candidate):
+                    seen.add(candidate)
+                    found.append(candidate)
+                    if len(found) >= limit:
+                        return found
+        if len(self.free) * len(word) <= crossing_num:
+            return found
+        for _ in xrange(min(free_tries, len(self.free) * 8)):
+            pos = self.rng.choice(self.free)
+            candidate = (pos / edge, pos % edge, self.rng.randrange(8))
+            if candidate not in seen and self._fits(word, *candidate):
+                seen.add(candidate)
+                found.append(candidate)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _place(self, word, row, col, direction):
+        dr, dc = DIRECTIONS[direction]
+        taken = []
+        for i, c in enumerate(word):
+            pos = (row + dr * i) * self.edge + col + dc * i
+            if self.puzzle[pos] == ANY:
+                self._take(pos, c)
+                taken.append(pos)
+        self.placed.append((word, row, col, direction))
+        return taken
+
+    def _unplace(self, taken):
+        for pos in taken:
+            self._release(pos)
+        self.placed.pop()
+
+    def generate(self, max_steps=MAX_STEPS, branching=3):
+        """
+        Returns (puzzle, placed) - the fullest board found and list of (word, row, col, direction)
+        """
+        words = self.words
+        #letters of words[i:] - bound of how many cells can be still filled
+        remaining = [0] * (len(words) + 1)
+        for i in xrange(len(words) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + len(words[i])
+        best = (len(self.free) + 1, None, None)
+        #frame: [word index, candidates, next candidate, taken cells of current choice, skipped]
+        frames = [[0, None, 0, None, False]]
+        steps = 0
+        while frames and steps < max_steps:
+            steps += 1
+            frame = frames[-1]
+            if frame[3] is not None:
+                self._unplace(frame[3])
+                frame[3] = None
+            index = frame[0]
+            if len(self.free) < best[0]:
+                best = (len(self.free), list(self.puzzle), list(self.placed))
+            if index == len(words) or len(self.free) - remaining[index] >= best[0]:
+                frames.pop()
+                continue
+            if frame[1] is None:
+                frame[1] = self.candidates(words[index], branching)
+            if frame[2] < len(frame[1]):
+                frame[3] = self._place(words[index], *frame[1][frame[2]])
+                frame[2] += 1
+                if not self.free:
+                    return list(self.puzzle), list(self.placed)
+                frames.append([index + 1, None, 0, None, False])
+            elif not frame[4]:
+                frame[4] = True
+                frames.append([index + 1, None, 0, None, False])
+            else:
+                frames.pop()
+        if len(self.free) < best[0]:
+            best = (len(self.free), list(self.puzzle), list(self.placed))
+        return best[1], best[2]
+
+def make_puzzle(edge, words, rng=random, max_steps=MAX_STEPS):
+    return PuzzleGenerator(edge, words, rng).generate(max_steps)
+
+def print_stats(puzzle, placed):
     print 'words placed:', len(placed)
-    print 'letters placed:', sum(map(len, placed))
-    print 'empty positions:', puzzle.count('*')
-    for word in placed: 
+    print 'letters placed:', sum(len(word) for word, row, col, direction in placed)
+    print 'empty positions:', puzzle.count(ANY)
+    for word, row, col, direction in placed:
         print word
-    return puzzle
-    
-def print_puzzle(puzzle):
-    for i in xrange(EDGE):
-        print ''.join(puzzle[i*EDGE: (i+1) * EDGE])
+
+def print_puzzle(puzzle, edge=EDGE):
+    for i in xrange(edge):
+        print ''.join(puzzle[i*edge: (i+1) * edge])
 
 if __name__ == '__main__':
+    edge = len(sys.argv) > 1 and int(sys.argv[1]) or EDGE
     fp = open(LIST, 'r')
     l = map(lambda x: x.strip(), list(fp.readlines()))
-    puzzle = make_puzzle(EDGE, l) 
-    print_puzzle(puzzle)
+    puzzle, placed = make_puzzle(edge, l)
+    print_stats(puzzle, placed)
+    print_puzzle(puzzle, edge)